@@ -0,0 +1,142 @@
+from typing import Callable, List, Optional, Sequence
+import fitz  # PyMuPDF
+from .delta import refresh_page_caches
+
+
+def move_page(doc: fitz.Document, index: int, new_index: int):
+    """Mueve la página `index` para que quede en `new_index` (índice final)."""
+    n = doc.page_count
+    # fitz.move_page coloca la página delante de 'to' (-1 => al final)
+    if new_index > index:
+        to = new_index + 1 if new_index + 1 < n else -1
+    else:
+        to = new_index
+    doc.move_page(index, to)
+
+
+class Command:
+    """
+    Edición que sabe deshacerse a sí misma sin copiar objetos del documento
+    (a diferencia de un Delta, que guarda el estado previo de todo lo que
+    la página alcanza). Se construye antes de editar y se cierra con
+    finish() justo después.
+    """
+    structure = False   # toca el árbol de páginas
+    pages = ()          # xrefs de páginas cuyo aspecto cambia
+
+    def finish(self, doc: fitz.Document):
+        pass
+
+    def is_empty(self) -> bool:
+        return False
+
+    def nbytes(self) -> int:
+        return 64
+
+    def blob_keys(self) -> List[bytes]:
+        return []
+
+    def apply(self, doc: fitz.Document, undo: bool, fetch: Optional[Callable] = None):
+        self._apply(doc, undo)
+        refresh_page_caches(doc, self.structure)
+
+    def _apply(self, doc: fitz.Document, undo: bool):
+        raise NotImplementedError
+
+
+class KeyCommand(Command):
+    """
+    Cambia el valor de una clave de un diccionario (p.ej. /Rotate o /Annots
+    de una página). Si la clave apunta a un objeto indirecto se guarda ese
+    objeto completo (arrays /Annots compartidos).
+    """
+    def __init__(self, doc: fitz.Document, xref: int, key: str):
+        self.pages = (xref,)
+        kind, val = doc.xref_get_key(xref, key)
+        if kind == 'xref':
+            self.xref, self.key = int(val.split()[0]), None
+        else:
+            self.xref, self.key = xref, key
+        self.before = self._read(doc)
+        self.after = self.before
+
+    def _read(self, doc: fitz.Document) -> str:
+        if self.key is None:
+            return doc.xref_object(self.xref, compressed=True)
+        return doc.xref_get_key(self.xref, self.key)[1]
+
+    def finish(self, doc: fitz.Document):
+        self.after = self._read(doc)
+
+    def is_empty(self) -> bool:
+        return self.after == self.before
+
+    def nbytes(self) -> int:
+        return len(self.before) + len(self.after) + 32
+
+    def _apply(self, doc: fitz.Document, undo: bool):
+        value = self.before if undo else self.after
+        if self.key is None:
+            doc.update_object(self.xref, value)
+        else:
+            doc.xref_set_key(self.xref, self.key, value)
+
+
+class MovePageCommand(Command):
+    structure = True
+
+    def __init__(self, index: int, new_index: int):
+        self.index = index
+        self.new_index = new_index
+
+    def _apply(self, doc: fitz.Document, undo: bool):
+        if undo:
+            move_page(doc, self.new_index, self.index)
+        else:
+            move_page(doc, self.index, self.new_index)
+
+
+class PageTreeCommand(Command):
+    """
+    Inserción (inserted=True) o retirada de una página del árbol. El objeto
+    página no se borra del documento: deshacer solo lo vuelve a enlazar
+    (o desenlazar) en la misma posición.
+    """
+    structure = True
+
+    def __init__(self, index: int, inserted: bool, xref: int = 0):
+        self.index = index
+        self.inserted = inserted
+        self.xref = xref
+
+    def finish(self, doc: fitz.Document):
+        if self.inserted:
+            self.xref = doc.page_xref(self.index)
+
+    def _apply(self, doc: fitz.Document, undo: bool):
+        if self.inserted != undo:
+            pdf = fitz.mupdf.pdf_document_from_fz_document(doc.this)
+            fitz.mupdf.pdf_insert_page(pdf, self.index, fitz.mupdf.pdf_new_indirect(pdf, self.xref, 0))
+        else:
+            doc._delete_page(self.index)
+
+
+class Batch(Command):
+    """Varios pasos registrados como uno solo (transacciones)."""
+    def __init__(self, steps: Sequence):
+        self.steps = list(steps)
+        self.structure = any(s.structure for s in self.steps)
+        self.pages = tuple(sorted({x for s in self.steps for x in s.pages}))
+
+    def is_empty(self) -> bool:
+        return all(s.is_empty() for s in self.steps)
+
+    def nbytes(self) -> int:
+        return sum(s.nbytes() for s in self.steps)
+
+    def blob_keys(self) -> List[bytes]:
+        return [k for s in self.steps for k in s.blob_keys()]
+
+    def apply(self, doc: fitz.Document, undo: bool, fetch: Optional[Callable] = None):
+        for step in (reversed(self.steps) if undo else self.steps):
+            step.apply(doc, undo, fetch)
@@ -0,0 +1,80 @@
+import hashlib
+import re
+from typing import Dict, Optional
+import fitz  # PyMuPDF
+
+_REF_RE = re.compile(r'(\d+) 0 R')
+_LENGTH_RE = re.compile(r'/Length(?![0-9a-zA-Z])\s*\d+(?:\s+0\s+R)?')
+_IMAGE_RE = re.compile(r'/Subtype\s*/Image(?![a-zA-Z])')
+_FONT_RE = re.compile(r'/Type\s*/(?:Font|FontDescriptor)(?![a-zA-Z])')
+
+
+def dedupe_resources(doc: fitz.Document, first: int, reuse_from: Optional[int] = None) -> int:
+    """
+    Fusiona fuentes e imágenes idénticas entre los objetos desde `first`
+    (p.ej. los injertados al insertar varios PDF que comparten logo y
+    fuentes): cada grupo de copias queda en un solo objeto, las
+    referencias se redirigen y las copias se borran del documento. Con
+    `reuse_from`, los objetos de [reuse_from, first) también sirven como
+    original, pero nunca se modifican ni se borran.
+    Se comparan las fuentes, las imágenes y todo lo que cuelga de ellas
+    (descriptores, programas de fuente, /W, ToUnicode, espacios de color
+    ICC, SMask...): streams con el mismo diccionario (salvo /Length) y los
+    mismos bytes en bruto, y objetos con el mismo texto una vez
+    redirigidas sus referencias; se repite hasta que no cambia (Type0 ->
+    CIDFont -> FontDescriptor -> FontFile). Los content streams y
+    formularios no se comparten: editar una página no debe cambiar otra.
+    Devuelve los objetos quitados.
+    """
+    start = first if reuse_from is None else reuse_from
+    text: Dict[int, str] = {}
+    for x in range(start, doc.xref_length()):
+        try:
+            text[x] = doc.xref_object(x, compressed=True)
+        except Exception:
+            pass
+    todo = [x for x, t in text.items()
+            if _FONT_RE.search(t) or (_IMAGE_RE.search(t) and doc.xref_is_stream(x))]
+    shared = set(todo)
+    while todo:
+        for n in _REF_RE.findall(text[todo.pop()]):
+            n = int(n)
+            if n in text and n not in shared:
+                shared.add(n)
+                todo.append(n)
+    digests = {x: hashlib.blake2b(doc.xref_stream_raw(x), digest_size=20).digest()
+               for x in shared if doc.xref_is_stream(x)}
+    remap: Dict[int, int] = {}
+
+    def canon(x: int) -> str:
+        return _REF_RE.sub(lambda m: f'{remap.get(int(m.group(1)), m.group(1))} 0 R', text[x])
+
+    merged = True
+    while merged:
+        seen, merged = {}, False
+        for x in sorted(shared):
+            if x in remap:
+                continue
+            key = (_LENGTH_RE.sub('', canon(x)), digests.get(x)) if x in digests else (canon(x), None)
+            keep = seen.setdefault(key, x)
+            if keep != x and x >= first:
+                remap[x] = keep
+                merged = True
+    if not remap:
+        return 0
+    for x in text:
+        if x < first or x in remap:
+            continue
+        new = canon(x)
+        if new == text[x]:
+            continue
+        if doc.xref_is_stream(x):
+            # update_object pierde el stream si venía del fichero: se repone
+            raw = doc.xref_stream_raw(x)
+            doc.update_object(x, new)
+            doc.update_stream(x, raw, compress=False)
+        doc.update_object(x, new)   # update_stream reescribe /Length y /Filter
+    pdf = fitz.mupdf.pdf_document_from_fz_document(doc.this)
+    for x in remap:
+        fitz.mupdf.pdf_delete_object(pdf, x)
+    return len(remap)
@@ -0,0 +1,212 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import fitz  # PyMuPDF
+from .history import BlobStore, content_key
+
+_REF_RE = re.compile(r'(\d+) 0 R')
+_PAGE_RE = re.compile(r'/Type\s*/Page(?![a-zA-Z])')
+_PARENT_RE = re.compile(r'/Parent\s*\d+ 0 R')
+_NULL = "null"
+
+
+@dataclass
+class Delta:
+    """
+    Cambio entre dos revisiones consecutivas del documento, a nivel de objeto
+    PDF (xref). Guarda solo los objetos que cambiaron: su diccionario y, si es
+    un stream, la clave de sus bytes en bruto dentro del BlobStore.
+    """
+    objs_before: Dict[int, str] = field(default_factory=dict)
+    objs_after: Dict[int, str] = field(default_factory=dict)
+    streams_before: Dict[int, bytes] = field(default_factory=dict)   # xref -> clave
+    streams_after: Dict[int, bytes] = field(default_factory=dict)
+    structure: bool = False                 # cambió el árbol de páginas
+    pages: Tuple[int, ...] = ()             # xrefs de páginas cuyo aspecto cambió
+
+    def is_empty(self) -> bool:
+        return not (self.objs_after or self.streams_after)
+
+    def nbytes(self) -> int:
+        n = 0
+        for d in (self.objs_before, self.objs_after):
+            n += sum(len(v) for v in d.values())
+        return n + 16 * (len(self.streams_before) + len(self.streams_after))
+
+    def blob_keys(self) -> List[bytes]:
+        return list(self.streams_before.values()) + list(self.streams_after.values())
+
+    def apply(self, doc: fitz.Document, undo: bool, fetch: Callable[[bytes], bytes]):
+        apply_delta(doc, self, undo, fetch)
+
+
+def _read_obj(doc: fitz.Document, xref: int) -> str:
+    try:
+        return doc.xref_object(xref, compressed=True)
+    except Exception:
+        # Objetos liberados (p.ej. tras deshacer una creación)
+        return _NULL
+
+
+def _read_stream(doc: fitz.Document, xref: int) -> Optional[bytes]:
+    try:
+        if not doc.xref_is_stream(xref):
+            return None
+        return doc.xref_stream_raw(xref)
+    except Exception:
+        return None
+
+
+def page_closure(doc: fitz.Document, page_xref: int) -> Set[int]:
+    """
+    Xrefs alcanzables desde una página (contenido, recursos, anotaciones...),
+    sin seguir /Parent ni entrar en otras páginas.
+    """
+    seen = {page_xref}
+    todo = [page_xref]
+    while todo:
+        xref = todo.pop()
+        src = _read_obj(doc, xref)
+        for m in _REF_RE.finditer(src):
+            ref = int(m.group(1))
+            if ref in seen or ref <= 0 or ref >= doc.xref_length():
+                continue
+            try:
+                kind, val = doc.xref_get_key(ref, "Type")
+            except Exception:
+                kind, val = None, None
+            if kind == 'name' and val in ('/Page', '/Pages'):
+                continue
+            seen.add(ref)
+            todo.append(ref)
+    return seen
+
+
+class DeltaRecorder:
+    """
+    Acumula el estado previo de los objetos que una edición va a tocar y, al
+    cerrar, produce el Delta con lo que realmente cambió.
+
+    - track_page: diccionarios y streams alcanzables desde la página.
+    - track_structure: diccionarios de todos los objetos (operaciones sobre el
+      árbol de páginas; los streams existentes no se modifican).
+    Los objetos creados durante la edición se detectan por xref_length.
+    Los streams se guardan en `store` y se comparan por clave de contenido:
+    un stream que no cambió no se duplica ni se copia al delta.
+    """
+    def __init__(self, doc: fitz.Document, store: BlobStore):
+        self.doc = doc
+        self.store = store
+        self.start_len = doc.xref_length()
+        self._objs: Dict[int, str] = {}
+        self._streams: Dict[int, Optional[bytes]] = {}   # xref -> clave previa
+        self._pages: Set[int] = set()
+        self._structure = False
+
+    def track_page(self, page_index: int):
+        xref = self.doc.page_xref(page_index)
+        self._pages.add(xref)
+        for x in page_closure(self.doc, xref):
+            if x not in self._objs:
+                self._objs[x] = _read_obj(self.doc, x)
+            if x not in self._streams:
+                self._streams[x] = self._put(_read_stream(self.doc, x))
+
+    def track_structure(self):
+        self._structure = True
+        for x in range(1, self.start_len):
+            if x not in self._objs:
+                self._objs[x] = _read_obj(self.doc, x)
+
+    def _put(self, data: Optional[bytes]) -> Optional[bytes]:
+        return None if data is None else self.store.put(data)
+
+    def discard(self):
+        """Suelta las referencias tomadas si la edición no llega a registrarse."""
+        self.store.release(k for k in self._streams.values() if k is not None)
+        self._streams.clear()
+
+    def finish(self) -> Delta:
+        """Produce el Delta; sus claves quedan referenciadas en `store`."""
+        doc = self.doc
+        delta = Delta(structure=self._structure, pages=tuple(sorted(self._pages)))
+        for x, before in self._objs.items():
+            after = _read_obj(doc, x)
+            if after != before:
+                delta.objs_before[x] = before
+                delta.objs_after[x] = after
+        if self._structure:
+            # Páginas existentes que cambiaron más allá de /Parent
+            # (p.ej. delete_page quita enlaces a la página borrada)
+            touched = {x for x, before in delta.objs_before.items()
+                       if _PAGE_RE.search(before)
+                       and _PARENT_RE.sub('', before) != _PARENT_RE.sub('', delta.objs_after[x])}
+            delta.pages = tuple(sorted(self._pages | touched))
+        unchanged = []
+        for x, before in self._streams.items():
+            data = _read_stream(doc, x)
+            if data is None or (before is not None and content_key(data) == before):
+                if before is not None:
+                    unchanged.append(before)
+                continue
+            if before is not None:
+                delta.streams_before[x] = before
+            delta.streams_after[x] = self.store.put(data)
+            # El diccionario acompaña al stream (/Length, /Filter)
+            delta.objs_before.setdefault(x, self._objs.get(x, _NULL))
+            delta.objs_after.setdefault(x, _read_obj(doc, x))
+        self.store.release(unchanged)
+        self._streams.clear()
+        for x in range(self.start_len, doc.xref_length()):
+            delta.objs_before[x] = _NULL
+            delta.objs_after[x] = _read_obj(doc, x)
+            data = _read_stream(doc, x)
+            if data is not None:
+                delta.streams_after[x] = self.store.put(data)
+        return delta
+
+
+def apply_delta(doc: fitz.Document, delta: Delta, undo: bool, fetch: Callable[[bytes], bytes]):
+    """
+    Lleva el documento al estado previo (undo) o posterior (redo) del delta.
+    `fetch` resuelve las claves de stream (BlobStore.get).
+    """
+    objs = delta.objs_before if undo else delta.objs_after
+    streams = delta.streams_before if undo else delta.streams_after
+    shown = fitz.TOOLS.mupdf_display_errors()
+    # Mientras se restauran, otros objetos pueden apuntar a xrefs aún vacíos
+    fitz.TOOLS.mupdf_display_errors(False)
+    try:
+        # Un guardado con los objetos creados ya deshechos recorta la tabla xref
+        while doc.xref_length() <= max(objs, default=0):
+            doc.get_new_xref()
+        for x, src in objs.items():
+            if src == _NULL:
+                continue
+            doc.update_object(x, src)
+            key = streams.get(x)
+            if key is not None:
+                data = fetch(key)
+                # update_stream reescribe /Length y /Filter: restaurar el dict después
+                doc.update_stream(x, data, compress=False)
+                doc.update_object(x, src)
+        for x, src in objs.items():
+            if src == _NULL:
+                doc.update_object(x, _NULL)
+    finally:
+        fitz.TOOLS.mupdf_display_errors(shown)
+    refresh_page_caches(doc, delta.structure)
+
+
+def refresh_page_caches(doc: fitz.Document, structure: bool):
+    # Las páginas cargadas guardan anotaciones/recursos ya resueltos
+    doc._reset_page_refs()
+    if not structure:
+        return
+    # MuPDF cachea el mapa número->objeto de página; tras reescribir /Kids
+    # a mano hay que descartarlo (fitz lo hace igual en move_page/delete_page).
+    try:
+        pdf = fitz.mupdf.pdf_document_from_fz_document(doc.this)
+        fitz.mupdf.ll_pdf_drop_page_tree_internal(pdf.m_internal)
+    except Exception:
+        pass
@@ -1,102 +1,848 @@
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import hashlib
 import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
 import pikepdf
 import fitz  # PyMuPDF
 from .font_manager import FontManager
+from .delta import DeltaRecorder
+from .dedupe import dedupe_resources
+from .render_cache import RenderCache, tile_clip
+from .raster_worker import RasterWorker
+from .save_worker import COMPACT_SAVE, SaveJob, incremental_tail, temp_path
+from .thumb_cache import default_cache_dir
+from .commands import Batch, Command, KeyCommand, MovePageCommand, PageTreeCommand, move_page
+
+_REF_RE = re.compile(r'(\d+) (\d+) R')
+_NULL_RE = re.compile(r'/[^\s/<>\[\]()]+\s*null(?![a-zA-Z])')     # /Clave null == sin clave
+_STREAM_KEYS = ('Length', 'Filter', 'DecodeParms')
+
+# A partir de este tamaño open() lee de un fichero en disco y no de memoria
+LOW_MEMORY_BYTES = 128 * 1024 * 1024
+_READ_CHUNK = 8 * 1024 * 1024
+_INDEX_BATCH = 2000     # páginas por paso de open_steps('index')
+_SOURCE_SLACK = 1024 * 1024  # hueco tras el original en memoria para los guardados incrementales
+
+
+class _FileReader(threading.Thread):
+    """
+    Lee `src` a memoria (o lo copia a `dst`) por bloques en un hilo;
+    cancelable. `data` es una vista de solo lectura: fitz la usa tal cual
+    (un bytearray lo copiaría entero); `buffer` deja _SOURCE_SLACK libres
+    detrás.
+    """
+    def __init__(self, src: str, dst: Optional[str] = None):
+        super().__init__(daemon=True)
+        self.src, self.dst = src, dst
+        self.size = os.path.getsize(src)
+        self.read = 0
+        self.data: Optional[memoryview] = None
+        self.buffer: Optional[bytearray] = None
+        self.error: Optional[Exception] = None
+        self.cancel = threading.Event()
+        self.start()
+
+    def run(self):
+        try:
+            buf = bytearray(self.size + _SOURCE_SLACK if self.dst is None else _READ_CHUNK)
+            view = memoryview(buf)
+            with open(self.src, 'rb') as f:
+                out = open(self.dst, 'wb') if self.dst else None
+                try:
+                    while not self.cancel.is_set():
+                        if out is None:
+                            n = f.readinto(view[self.read:self.read + _READ_CHUNK])
+                        else:
+                            n = f.readinto(view)
+                            out.write(view[:n])
+                        if not n:
+                            break
+                        self.read += n
+                finally:
+                    if out is not None:
+                        out.close()
+            if self.dst is None:
+                self.data, self.buffer = view[:self.read].toreadonly(), buf
+        except Exception as e:
+            self.error = e
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill terminaría el proceso; Windows no deja borrar un fichero abierto
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class PageChanges:
+    """
+    Cambios de páginas entre dos llamadas a DocumentManager.page_changes().
+    Índices "nuevos" = posición actual; "anteriores" = en el informe previo.
+    """
+    reset: bool = False                                     # documento nuevo: todo cambió
+    old_index: List[Optional[int]] = field(default_factory=list)  # por índice nuevo (None = insertada)
+    changed: Set[int] = field(default_factory=set)          # índices nuevos con otro aspecto
+    removed: List[int] = field(default_factory=list)        # índices anteriores eliminados
+
+    @property
+    def inserted(self) -> List[int]:
+        return [i for i, o in enumerate(self.old_index) if o is None]
+
+    @property
+    def reordered(self) -> bool:
+        kept = [o for o in self.old_index if o is not None]
+        return kept != sorted(kept)
+
+    def is_empty(self) -> bool:
+        return not (self.reset or self.changed or self.removed or self.inserted or self.reordered)
+
 
 class DocumentManager:
-    def __init__(self):
+    def __init__(self, render_cache_bytes: int = 256 * 1024 * 1024, display_lists: int = 16):
         self._pike_doc: Optional[pikepdf.Pdf] = None
         self._fitz_doc: Optional[fitz.Document] = None
         self.path: Optional[str] = None
         self.dirty: bool = False
         self._history = None  # HistoryManager opcional
         self._font_manager: Optional[FontManager] = None
+        self._tx_depth = 0          # transacciones anidadas abiertas
+        self._tx_changed = False    # hubo ediciones dentro de la transacción
+        self._capture: Optional[DeltaRecorder] = None  # estado previo de la edición en curso
+        self._command: Optional[Command] = None        # edición en curso con inversa propia
+        self._steps: list = []                          # pasos cerrados del paso de historial en curso
+        self.render_cache = RenderCache(render_cache_bytes)
+        # Contenido ya interpretado por página (xref -> (revisión, DisplayList)), LRU
+        self._display_lists: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._display_list_max = display_lists
+        self._sizes: Dict[int, tuple] = {}              # xref -> (revisión, (ancho, alto))
+        self._page_revs: Dict[int, int] = {}            # xref de página -> revisión de contenido
+        self._touched: set = set()                      # páginas editadas desde el último cambio
+        self._source: Optional[Union[bytes, memoryview]] = None   # bytes tal y como se abrieron (o guardaron)
+        self._source_buf: Optional[bytearray] = None    # bajo _source, con hueco detrás (_append_source)
+        self._backing: Optional[str] = None             # en vez de _source: copia privada en disco (low_memory)
+        self._backing_edits = 0                         # _edits cuando _backing coincidía con el documento
+        self._stale: List[str] = []                     # copias anteriores que aún pueden leer los procesos de render
+        self._pike_file: Optional[str] = None           # instantánea en disco que lee _pike_doc (low_memory)
+        self._raster_failed = False
+        self._edits = 0                                 # ediciones desde que se abrió (dirty tras guardar en 2º plano)
+        self._opened = 0                                # documentos abiertos (un guardado en curso es de cuál)
+        self._pristine: Dict[int, int] = {}             # xref -> revisión que tiene el proceso de render
+        self._raster: Optional[RasterWorker] = None
+        self._reported: Optional[List[int]] = None      # xrefs de páginas en el último page_changes()
+        self._reported_revs: Dict[int, int] = {}
+        self._content_keys: Dict[int, tuple] = {}       # xref de página -> (revisión, clave)
+        self._stream_digests: Dict[int, bytes] = {}     # xref -> hash del stream (sin tocar desde entonces)
+        self._xref_set: Optional[set] = None            # xrefs de página actuales (hasta la próxima edición)
 
-    def open(self, path: str):
-        self.close()
-        self._pike_doc = pikepdf.Pdf.open(path)
-        self._fitz_doc = fitz.open(path)
+    def open(self, path: str, low_memory: Optional[bool] = None):
+        """Abre de una vez (ver open_steps)."""
+        for stage, _ in self.open_steps(path, low_memory):
+            if stage == 'read':
+                time.sleep(0.01)
+
+    def open_steps(self, path: str, low_memory: Optional[bool] = None) -> Iterator[Tuple[str, float]]:
+        """
+        Apertura por etapas para repartirla entre eventos de la UI; cada
+        yield devuelve el control con (etapa, avance 0..1):
+        'read'  el fichero se lee en un hilo (la E/S suelta el GIL); el
+                documento anterior sigue abierto;
+        'ready' documento abierto: ya se puede mostrar la página 1;
+        'index' páginas que pueden ir a los procesos de render, por bloques
+                (se para si se edita antes de terminar).
+        Al acabar quedan registradas las fuentes externas. Cerrar el
+        generador en 'read' cancela (y deja el documento anterior); después
+        cierra el nuevo.
+
+        fitz es el documento vivo; pikepdf se construye bajo demanda (_pike).
+        No se lee del fichero del usuario para poder sobrescribirlo al guardar:
+        - en memoria (por defecto hasta LOW_MEMORY_BYTES): una copia en bytes;
+        - low_memory: una copia privada en la caché de disco de la que
+          MuPDF, pikepdf y los procesos de render leen bajo demanda; en RAM
+          solo queda lo que se usa.
+        """
+        if low_memory is None:
+            low_memory = os.path.getsize(path) >= LOW_MEMORY_BYTES
+        backing = self._new_backing() if low_memory else None
+        reader = _FileReader(path, backing)
+        try:
+            while reader.is_alive():
+                yield 'read', reader.read / max(reader.size, 1)
+            if reader.error:
+                raise reader.error
+            self.close()
+            if backing:
+                self._fitz_doc = fitz.open(backing, filetype="pdf")
+                self._backing, backing = backing, None
+            else:
+                self._fitz_doc = fitz.open(stream=reader.data, filetype="pdf")
+                self._source, self._source_buf = reader.data, reader.buffer
+        except BaseException:
+            reader.cancel.set()
+            reader.join()
+            if backing:
+                self._remove_file(backing)
+            raise
+        self._opened += 1
+        opened = self._opened
+        self._backing_edits = self._edits
         self.path = path
         self.dirty = False
         self._notify_history(initial=True)
-        if self._font_manager:
-            self._register_external_fonts()
+        try:
+            yield 'ready', 0.0
+            count = self._fitz_doc.page_count
+            for first in range(0, count, _INDEX_BATCH):
+                # Tras editar, índices y xrefs ya no son los del fichero
+                if self._opened != opened or self._edits != self._backing_edits:
+                    break
+                last = min(count, first + _INDEX_BATCH)
+                for i in range(first, last):
+                    self._pristine.setdefault(self._fitz_doc.page_xref(i), 0)
+                yield 'index', last / count
+            if self._opened == opened and self._font_manager:
+                self._register_external_fonts()
+        except GeneratorExit:
+            if self._opened == opened:
+                self.close()
+            raise
 
     def is_open(self) -> bool:
-        return self._pike_doc is not None
+        return self._fitz_doc is not None
 
     def page_count(self) -> int:
         return 0 if not self._fitz_doc else self._fitz_doc.page_count
 
+    def _pike(self) -> Optional[pikepdf.Pdf]:
+        """
+        Vista pikepdf del documento. Se materializa desde fitz solo cuando hace
+        falta (guardar, extraer...) y se descarta en cuanto fitz cambia.
+        """
+        if not self._fitz_doc:
+            return None
+        if self._pike_doc is None and self._backing is None:
+            self._pike_doc = pikepdf.Pdf.open(io.BytesIO(self._fitz_doc.tobytes()))
+        elif self._pike_doc is None:
+            # low_memory: QPDF también lee bajo demanda de disco
+            if self._edits == self._backing_edits:
+                self._pike_doc = pikepdf.Pdf.open(self._backing)
+            else:
+                self._pike_file = self._new_backing()
+                self._fitz_doc.save(self._pike_file)
+                self._pike_doc = pikepdf.Pdf.open(self._pike_file)
+        return self._pike_doc
+
+    def _drop_pike(self):
+        if self._pike_doc is not None:
+            try:
+                self._pike_doc.close()
+            except Exception:
+                pass
+            self._pike_doc = None
+        if self._pike_file:
+            self._remove_file(self._pike_file)
+            self._pike_file = None
+
+    def _fitz_changed(self):
+        """Tras editar fitz in situ: invalida pikepdf y registra historial."""
+        self._drop_pike()
+        self.dirty = True
+        self._edits += 1
+        self._touch_pages(self._touched)
+        self._touched.clear()
+        if self._command is not None:
+            self._command.finish(self._fitz_doc)
+            self._steps.append(self._command)
+            self._command = None
+        if self._tx_depth:
+            self._tx_changed = True
+            return
+        self._notify_history()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa varias ediciones en un único paso de historial:
+
+            with doc.transaction():
+                for r in rects:
+                    doc.add_highlight_rect(0, r)
+
+        Se puede anidar; el snapshot se registra al cerrar la más externa.
+        """
+        self._tx_depth += 1
+        try:
+            yield self
+        finally:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                if self._tx_changed:
+                    self._tx_changed = False
+                    self._notify_history()
+                else:
+                    self._discard_capture()   # solo ediciones fallidas
+
     def get_page_pixmap(self, index: int, zoom: float = 0.2):
         if not self._fitz_doc:
             raise ValueError("No document open")
-        page = self._fitz_doc.load_page(index)
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
+        # Caché por (página, revisión, zoom): el pixmap devuelto es compartido
+        xref, key = self._render_key(index, zoom)
+        pix = self.render_cache.get(xref, key)
+        if pix is None:
+            mat = fitz.Matrix(zoom, zoom)
+            pix = self.display_list(index).get_pixmap(matrix=mat, alpha=False)
+            self.render_cache.put(xref, key, pix)
         return pix
 
+    def get_tile_pixmap(self, index: int, zoom: float, tile):
+        """
+        Solo la tesela (tx, ty) de la página a ese zoom (ver render_cache.TILE_SIZE).
+        pix.x / pix.y dan su posición dentro de la página renderizada completa.
+        """
+        if not self._fitz_doc:
+            raise ValueError("No document open")
+        xref, key = self._render_key(index, zoom, tile)
+        pix = self.render_cache.get(xref, key)
+        if pix is None:
+            pix = self.display_list(index).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False,
+                                                      clip=tile_clip(zoom, tile))
+            self.render_cache.put(xref, key, pix)
+        return pix
+
+    def display_list(self, index: int) -> fitz.DisplayList:
+        """
+        Contenido de la página ya interpretado (con anotaciones): rasterizarlo
+        a otro zoom o recorte no vuelve a leer el content stream. Se rehace
+        cuando la página cambia de revisión.
+        """
+        xref, rev = self.page_revision(index)
+        entry = self._display_lists.get(xref)
+        if entry and entry[0] == rev:
+            self._display_lists.move_to_end(xref)
+            return entry[1]
+        dl = self._fitz_doc.load_page(index).get_displaylist()
+        self._display_lists[xref] = (rev, dl)
+        self._display_lists.move_to_end(xref)
+        while len(self._display_lists) > self._display_list_max:
+            self._display_lists.popitem(last=False)
+        return dl
+
+    def _render_key(self, index: int, zoom: float, tile=None):
+        xref = self._fitz_doc.page_xref(index)
+        return xref, (self._page_revs.get(xref, 0), round(zoom, 4), tile)
+
+    def cached_pixmap(self, index: int, zoom: float, tile=None):
+        """Pixmap (o tesela) ya renderizado o None (no rasteriza)."""
+        if not self._fitz_doc:
+            return None
+        xref, key = self._render_key(index, zoom, tile)
+        return self.render_cache.get(xref, key)
+
+    def preview_pixmap(self, index: int, zoom: float):
+        """
+        Render ya cacheado de la página actual a otro zoom (el más cercano,
+        mejor por debajo), para mostrar escalado mientras llega el bueno.
+        Devuelve (pix, zoom) o None.
+        """
+        if not self._fitz_doc:
+            return None
+        xref, (rev, _, _) = self._render_key(index, zoom)
+        found = [(z, pix) for (r, z, tile), pix in self.render_cache.page_items(xref)
+                 if r == rev and tile is None]
+        if not found:
+            return None
+        below = [f for f in found if f[0] <= zoom]
+        z, pix = max(below, key=lambda f: f[0]) if below else min(found, key=lambda f: f[0])
+        return pix, z
+
+    def store_pixmap(self, xref: int, zoom: float, pix, tile=None, rev: int = 0):
+        """Guarda un render hecho fuera (RasterWorker) si la página sigue en la revisión `rev`."""
+        if self._fitz_doc and self._page_revs.get(xref, 0) == rev:
+            self.render_cache.put(xref, (rev, round(zoom, 4), tile), pix)
+
+    def pristine_xref(self, index: int) -> Optional[int]:
+        """
+        xref de la página si no ha cambiado desde que se abrió (o guardó) el
+        documento: el proceso de render la tiene igual.
+        """
+        xref = self._fitz_doc.page_xref(index)
+        if self._pristine.get(xref) == self._page_revs.get(xref, 0):
+            return xref
+        return None
+
+    def share_edited_page(self, index: int) -> Optional[tuple]:
+        """
+        Para que el proceso de render sirva también una página editada: le
+        pasa (una vez por revisión) un PDF con solo esa página, mucho más
+        barato de copiar que de rasterizar. Devuelve la clave para
+        RasterWorker.submit(page=...) o None (sin proceso o si falla).
+        """
+        worker = self._raster
+        if worker is None:
+            return None
+        key = self.page_revision(index)
+        if not worker.has_page(key):
+            one = fitz.open()
+            try:
+                one.insert_pdf(self._fitz_doc, from_page=index, to_page=index, links=False)
+                worker.share_page(key, one.tobytes())
+            except Exception:
+                return None
+            finally:
+                one.close()
+        return key
+
+    def raster_worker(self) -> Optional[RasterWorker]:
+        """Proceso de render en segundo plano (se arranca al primer uso)."""
+        if self._raster is None and self._fitz_doc and not self._raster_failed:
+            try:
+                self._raster = RasterWorker(self._backing or self._source or self._fitz_doc.tobytes())
+            except Exception:
+                self._raster_failed = True   # sin multiprocessing: todo en el hilo principal
+        return self._raster
+
+    def page_changes(self) -> PageChanges:
+        """
+        Qué páginas cambiaron, se insertaron, se quitaron o se movieron desde
+        la llamada anterior (para refrescos incrementales, p.ej. miniaturas).
+        Se deduce de la identidad (xref) y revisión de cada página, así que
+        vale igual para ediciones, deshacer y rehacer.
+        """
+        if not self._fitz_doc:
+            self._reported = None
+            return PageChanges(reset=True)
+        xrefs = [self._fitz_doc.page_xref(i) for i in range(self.page_count())]
+        revs = {x: self._page_revs.get(x, 0) for x in xrefs}
+        if self._reported is None:
+            changes = PageChanges(reset=True, old_index=[None] * len(xrefs))
+        else:
+            prev = {x: i for i, x in enumerate(self._reported)}
+            old_index = [prev.get(x) for x in xrefs]
+            kept = {o for o in old_index if o is not None}
+            changes = PageChanges(
+                old_index=old_index,
+                changed={i for i, x in enumerate(xrefs)
+                         if x in prev and revs[x] != self._reported_revs.get(x, 0)},
+                removed=[i for i in range(len(self._reported)) if i not in kept])
+        self._reported, self._reported_revs = xrefs, revs
+        return changes
+
+    def page_revision(self, index: int) -> tuple:
+        """(xref, revisión) de la página: cambia solo si cambia su aspecto."""
+        xref = self._fitz_doc.page_xref(index)
+        return xref, self._page_revs.get(xref, 0)
+
+    def page_content_key(self, index: int) -> str:
+        """
+        Hash del aspecto de la página: su diccionario (sin /Parent), contenido,
+        recursos, anotaciones... todo lo alcanzable desde ella salvo otras
+        páginas, con las referencias renumeradas por orden de visita para
+        que no dependa de la numeración de objetos del archivo. Sirve de
+        clave para cachés persistentes (ver core.thumb_cache).
+        """
+        doc = self._fitz_doc
+        xref, rev = self.page_revision(index)
+        memo = self._content_keys.get(xref)
+        if memo and memo[0] == rev:
+            return memo[1]
+        page = doc[index]
+        if self._xref_set is None:
+            self._xref_set = {doc.page_xref(i) for i in range(self.page_count())}
+        pages = self._xref_set
+        h = hashlib.blake2b(digest_size=16)
+        # Atributos heredables (Resources/MediaBox/Rotate) pueden venir del árbol
+        h.update(f'{tuple(page.mediabox)} {tuple(page.cropbox)} {page.rotation}'.encode())
+        ids = {xref: 0}
+        order = [xref]
+
+        def canon(m):
+            ref = int(m.group(1))
+            if ref in pages and ref != xref:
+                return 'P'      # destino en otra página: no forma parte del aspecto
+            if ref not in ids:
+                ids[ref] = len(ids)
+                order.append(ref)
+            return f'{ids[ref]} R'
+        res = doc.xref_get_key(xref, 'Resources')
+        parent = doc.xref_get_key(xref, 'Parent')
+        while res[0] == 'null' and parent[0] == 'xref':
+            node = int(parent[1].split()[0])
+            res = doc.xref_get_key(node, 'Resources')
+            parent = doc.xref_get_key(node, 'Parent')
+        h.update(_REF_RE.sub(canon, res[1]).encode())
+        for x in order:     # crece mientras se recorre
+            stream = doc.xref_is_stream(x)
+            # Streams por datos decodificados (otra compresión al guardar no cambia
+            # la clave), salvo imágenes: decodificar un JPEG cuesta tanto como un render
+            decoded = stream and doc.xref_get_key(x, 'Subtype')[1] != '/Image'
+            skip = _STREAM_KEYS if decoded else ('Parent',) if x == xref else ()
+            keys = doc.xref_get_keys(x)
+            if keys:    # diccionario: claves ordenadas (cada escritor usa su orden)
+                obj = ''.join(f'/{k} {v}' for k in sorted(keys) if k not in skip
+                              for t, v in [doc.xref_get_key(x, k)] if t != 'null')
+            else:
+                obj = doc.xref_object(x, compressed=True)
+            h.update(_REF_RE.sub(canon, _NULL_RE.sub('', obj)).encode())
+            if stream:
+                digest = self._stream_digests.get(x)
+                if digest is None:
+                    data = doc.xref_stream(x) if decoded else doc.xref_stream_raw(x)
+                    digest = hashlib.blake2b(data or b'', digest_size=16).digest()
+                    self._stream_digests[x] = digest
+                h.update(digest)
+        key = h.hexdigest()
+        self._content_keys[xref] = (rev, key)
+        return key
+
+    def _touch_pages(self, xrefs: Iterable[int]):
+        for xref in xrefs:
+            self._page_revs[xref] = self._page_revs.get(xref, 0) + 1
+            self.render_cache.drop_page(xref)
+            self._display_lists.pop(xref, None)
+        self._stream_digests.clear()    # un stream compartido pudo cambiar
+        self._xref_set = None
+
+    def _page_links(self) -> Dict[int, str]:
+        """
+        /Annots de cada página con enlaces (el array, aunque sea indirecto):
+        delete_page quita los enlaces a la página borrada de las demás.
+        """
+        doc = self._fitz_doc
+        out = {}
+        for i in range(doc.page_count):
+            xref = doc.page_xref(i)
+            kind, val = doc.xref_get_key(xref, 'Annots')
+            if kind == 'xref':
+                val = doc.xref_object(int(val.split()[0]), compressed=True)
+            if kind != 'null':
+                out[xref] = val
+        return out
+
+    def _touch_relinked(self, before: Dict[int, str]):
+        """Tras delete_page: nueva revisión solo para las páginas cuyos enlaces cambiaron."""
+        if not before:
+            return
+        after = self._page_links()
+        self._touch_pages([x for x, v in before.items() if x in after and after[x] != v])
+
     def remove_page(self, index: int):
-        if not self._pike_doc or not self._fitz_doc:
+        if not self._fitz_doc:
             return
-        # Remove in pikepdf
-        del self._pike_doc.pages[index]
-        # Rebuild fitz doc from buffer
-        buf = io.BytesIO()
-        self._pike_doc.save(buf)
-        buf.seek(0)
-        self._fitz_doc.close()
-        self._fitz_doc = fitz.open(stream=buf.getvalue(), filetype="pdf")
-        self.dirty = True
-        self._notify_history()
+        if index < 0 or index >= self.page_count():
+            return
+        doc = self._fitz_doc
+        links = doc.has_links()
+        if links or doc.get_toc():
+            # delete_page también limpia marcadores (no cambian ninguna página)
+            # y enlaces a la página borrada (cambian las que los tenían)
+            before = self._page_links() if links else {}
+            self._track_structure()
+            doc.delete_page(index)
+            self._touch_relinked(before)
+        else:
+            self._track_command(PageTreeCommand(index, inserted=False, xref=doc.page_xref(index)))
+            doc._delete_page(index)
+            doc._reset_page_refs()
+        self._fitz_changed()
 
     def insert_pdf(self, other_path: str):
-        if not self._pike_doc or not self._fitz_doc:
-            # If no doc open, just open the other
-            self.open(other_path)
-            return
-        other = pikepdf.Pdf.open(other_path)
-        for page in other.pages:
-            self._pike_doc.pages.append(page)
-        # Refresh fitz doc
-        buf = io.BytesIO()
-        self._pike_doc.save(buf)
-        buf.seek(0)
-        self._fitz_doc.close()
-        self._fitz_doc = fitz.open(stream=buf.getvalue(), filetype="pdf")
-        self.dirty = True
-        self._notify_history()
+        self.insert_pdfs([other_path])
+
+    def insert_pdfs(self, paths: Sequence[str], start_at: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        Añade varios PDF de una pasada (al final, o desde `start_at`) como un
+        solo paso de historial. Cada origen se cierra en cuanto se ha
+        copiado y al final se fusionan las fuentes e imágenes idénticas
+        entre ellos (dedupe_resources): 200 facturas con el mismo logo y
+        las mismas fuentes los guardan una vez. Sin documento abierto, el
+        primero se abre como documento sin título (Guardar pide destino:
+        no se sobrescribe ese origen) y el resto se le añade.
+        progress(hechos, total). Devuelve páginas añadidas y objetos fusionados.
+        """
+        paths = list(paths)
+        if not paths:
+            return {'pages': 0, 'merged': 0}
+        reuse, before = None, self.page_count()
+        if not self._fitz_doc:
+            self.open(paths.pop(0))
+            self.path = None
+            self.dirty = True
+            reuse = 1   # el abierto es de esta misma mezcla: sus fuentes también valen
+        doc = self._fitz_doc
+        first = doc.xref_length()
+        at = doc.page_count if start_at is None else start_at
+        merged = 0
+        self._track_structure()
+        try:
+            for done, path in enumerate(paths, 1):
+                other = fitz.open(path)
+                try:
+                    n = doc.page_count
+                    doc.insert_pdf(other, start_at=at)
+                    at += doc.page_count - n
+                finally:
+                    other.close()
+                if progress:
+                    progress(done, len(paths))
+        finally:
+            if doc.xref_length() > first:
+                merged = dedupe_resources(doc, first, reuse)
+                self._fitz_changed()
+            else:
+                self._drop_failed_edit()
+        return {'pages': doc.page_count - before, 'merged': merged}
 
     def reorder_pages(self, new_order: List[int]):
-        if not self._pike_doc or not self._fitz_doc:
+        if not self._fitz_doc:
             return
         if sorted(new_order) != list(range(self.page_count())):
             raise ValueError("Invalid new order list")
-        # Rebuild with new order
-        new_pdf = pikepdf.Pdf.new()
-        for idx in new_order:
-            new_pdf.pages.append(self._pike_doc.pages[idx])
-        self._pike_doc = new_pdf
-        buf = io.BytesIO()
-        self._pike_doc.save(buf)
-        buf.seek(0)
-        self._fitz_doc.close()
-        self._fitz_doc = fitz.open(stream=buf.getvalue(), filetype="pdf")
-        self.dirty = True
-        self._notify_history()
+        if new_order == list(range(self.page_count())):
+            return
+        self._track_structure()
+        self._fitz_doc.select(new_order)
+        self._fitz_changed()
 
-    def save_as(self, path: str):
-        if not self._pike_doc:
+    def move_page(self, index: int, new_index: int):
+        """
+        Mueve una página a la posición new_index (índice final) sin reconstruir
+        el resto del árbol de páginas.
+        """
+        if not self._fitz_doc:
             return
-        self._pike_doc.save(path)
-        self.path = path
-        self.dirty = False
+        n = self.page_count()
+        if not (0 <= index < n and 0 <= new_index < n) or index == new_index:
+            return
+        self._track_command(MovePageCommand(index, new_index))
+        move_page(self._fitz_doc, index, new_index)
+        self._fitz_changed()
+
+    def save_as(self, path: str):
+        self._finish_sync(self.start_save(path, 'pike'))
+
+    def save_optimized(self, path: str, linearize: bool = False) -> dict:
+        """
+        Guardar como... con la salida más pequeña: fusiona objetos duplicados
+        (fuentes, imágenes repetidas tras insertar/duplicar), quita los no
+        referenciados, genera flujos de objetos y recomprime los streams flate;
+        linearize=True además ordena el fichero para mostrar la primera
+        página antes de descargarlo entero. Devuelve tamaños y tiempo.
+        """
+        if not self._fitz_doc:
+            return {}
+        return self.save_report(self._finish_sync(self.start_save(path, 'optimize', linearize)))
 
-    def save(self):
+    def save(self, compact: bool = False):
+        """
+        Guarda en self.path: el fichero abierto (o último guardado) más solo
+        los objetos cambiados y una nueva tabla xref (actualización
+        incremental). compact=True reescribe el fichero entero sin objetos
+        huérfanos ni revisiones anteriores.
+        """
         if not self.path:
             raise ValueError("No existing path; use save_as")
-        self.save_as(self.path)
+        if not self._fitz_doc:
+            return
+        self._finish_sync(self.start_save(self.path, 'compact' if compact else None))
+
+    def start_save(self, path: str, mode: Optional[str] = None, linearize: bool = False) -> SaveJob:
+        """
+        Guardado sin bloquear: en el hilo principal solo se toma la
+        instantánea en un temporal junto a `path`. Un guardado incremental
+        solo serializa ahí los objetos cambiados + xref (tras un hueco del
+        tamaño del original, que llena SaveJob); el resto escribe el
+        documento entero. La reescritura (`mode` 'compact', 'pike' u
+        'optimize', ver save_worker), la copia del original, el volcado a
+        disco y el rename atómico van en segundo plano. Se puede seguir
+        editando; al terminar (job.done) hay que llamar a finish_save(job)
+        desde el hilo principal.
+        """
+        if not self._fitz_doc:
+            raise ValueError("No document open")
+        before = os.path.getsize(self._backing) if self._backing else \
+            len(self._source) if self._source is not None else None
+        snapshot = temp_path(path)
+        base = None
+        try:
+            if mode is None and before is not None and self._fitz_doc.can_save_incrementally():
+                tail = incremental_tail(self._fitz_doc, self._backing or self._source, before)
+                with open(snapshot, 'r+b') as f:
+                    f.seek(before)  # hueco (disperso) para el original: lo llena SaveJob
+                    f.write(tail)
+                base = open(self._backing, 'rb') if self._backing else self._source
+                self._adopt(tail=tail)
+            elif mode is None:
+                # Sin recolectar basura: el historial aún apunta a objetos sin uso
+                self._fitz_doc.save(snapshot)
+                self._adopt(snapshot)
+            else:
+                self._fitz_doc.save(snapshot)
+        except Exception:
+            if hasattr(base, 'close'):
+                base.close()
+            os.remove(snapshot)
+            raise
+        return SaveJob(snapshot, path, mode, linearize, base=base, base_size=before or 0,
+                       opened=self._opened, edits=self._edits, before=before)
+
+    def finish_save(self, job: SaveJob) -> bool:
+        """
+        Aplica un guardado terminado si el documento sigue abierto: nueva
+        ruta y, si no se editó mientras tanto, dirty=False. Lo escrito por
+        'compact', 'pike' u 'optimize' no se adopta: quita objetos sin uso
+        a los que el historial aún apunta (páginas borradas, anotaciones
+        deshechas), así que el siguiente guardado incremental sigue
+        partiendo del documento vivo.
+        """
+        if job.error is not None:
+            return False
+        if job.info['opened'] != self._opened:
+            return True
+        self.path = job.path
+        if job.info['edits'] == self._edits:
+            self.dirty = False
+        return True
+
+    @staticmethod
+    def save_report(job: SaveJob) -> dict:
+        return {'before': job.info['before'], 'after': os.path.getsize(job.path),
+                'seconds': job.seconds, 'linearized': job.linearize}
+
+    def _finish_sync(self, job: SaveJob) -> SaveJob:
+        job.wait()
+        if not self.finish_save(job):
+            raise OSError(job.error)
+        return job
+
+    def _adopt(self, path: Optional[str] = None, tail: bytes = b''):
+        """
+        Tras guardar: el documento vivo pasa a leer de lo guardado, para
+        que el siguiente incremental se calcule sobre ello (MuPDF da por
+        hecho que el original ya lleva lo escrito). `path` es un fichero
+        completo; sin él, `tail` (el final incremental) se añade al original
+        en memoria o a la copia en disco. Solo vale para salidas sin
+        recolección de basura: los números de objeto y los objetos sin uso
+        se conservan (historial, revisiones y cachés siguen valiendo).
+        """
+        old = self._fitz_doc
+        if self._capture is not None:
+            # Captura abierta sobre el documento que se cierra: dentro de una
+            # transacción se cierra ya; fuera, es una edición que no llegó a nada
+            if self._tx_depth:
+                self._steps.append(self._capture.finish())
+                self._capture = None
+            else:
+                self._discard_capture()
+        if self._backing is None:
+            if path is None:
+                self._append_source(tail)
+            else:
+                with open(path, 'rb') as f:
+                    self._source, self._source_buf = f.read(), None
+            self._fitz_doc = fitz.open(stream=self._source, filetype="pdf")
+        elif path is None:
+            # Añadir al final no cambia lo que ya leen el render o pikepdf
+            with open(self._backing, 'ab') as f:
+                f.write(tail)
+            self._fitz_doc = fitz.open(self._backing, filetype="pdf")
+        else:
+            backing = self._new_backing(path)
+            self._fitz_doc = fitz.open(backing, filetype="pdf")
+            self._stale.append(self._backing)   # el proceso de render puede seguir en él
+            self._backing = backing
+        old.close()
+        # Lo guardado es el estado actual: las páginas editadas vuelven a poder
+        # ir al proceso de render, que se relanza (al primer uso) sobre ello
+        doc = self._fitz_doc
+        seeded = {x: self._page_revs.get(x, 0) for x in map(doc.page_xref, range(doc.page_count))}
+        if seeded != self._pristine:
+            self._pristine = seeded
+            if self._raster is not None:
+                self._raster.close(wait=False)
+                self._raster = None
+        if self._raster is None:
+            self._drop_stale()
+        self._backing_edits = self._edits
+        self._drop_pike()
+        self._display_lists.clear()
+        self._xref_set = None
+
+    def _append_source(self, tail: bytes):
+        """
+        Añade `tail` a _source. Si cabe en el hueco de _source_buf no se
+        copia el original: los bytes que ya usan el documento anterior o un
+        SaveJob en curso no cambian.
+        """
+        n = len(self._source)
+        end = n + len(tail)
+        buf = self._source_buf
+        if buf is None or end > len(buf):
+            buf = bytearray(end + _SOURCE_SLACK)
+            buf[:n] = self._source
+            self._source_buf = buf
+        buf[n:end] = tail
+        self._source = memoryview(buf)[:end].toreadonly()
+
+    @staticmethod
+    def _new_backing(src: Optional[str] = None) -> str:
+        """
+        Fichero privado en la caché de disco; con `src`, copia de él (un
+        enlace duro vería lo que otros escriban en el fichero del usuario).
+        El nombre lleva el pid: remove_stale_backings sabe de quién es.
+        """
+        folder = default_cache_dir('open')
+        os.makedirs(folder, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f'{os.getpid()}-', suffix='.pdf', dir=folder)
+        os.close(fd)
+        if src is not None:
+            shutil.copyfile(src, path)
+        return path
+
+    @staticmethod
+    def remove_stale_backings():
+        """
+        Al arrancar: borra las copias en disco que dejó una sesión que no
+        cerró bien (de procesos que ya no existen, o sin pid en el nombre).
+        """
+        folder = default_cache_dir('open')
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+        for name in names:
+            pid = name.split('-', 1)[0]
+            if not (pid.isdigit() and _process_alive(int(pid))):
+                DocumentManager._remove_file(os.path.join(folder, name))
+
+    def _drop_stale(self):
+        self._stale = [p for p in self._stale if not self._remove_file(p)]
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
 
     def close(self):
         try:
@@ -104,144 +850,123 @@ class DocumentManager:
                 self._fitz_doc.close()
         finally:
             self._fitz_doc = None
-        try:
-            if self._pike_doc:
-                self._pike_doc.close()
-        finally:
-            self._pike_doc = None
+        self._drop_pike()
+        self._discard_capture()
+        if self._raster:
+            self._raster.close()
+            self._raster = None
+        self._raster_failed = False
+        self._source = self._source_buf = None
+        if self._backing:
+            self._stale.append(self._backing)
+            self._backing = None
+        self._drop_stale()
+        self._opened += 1
+        self._pristine = {}
+        self._reported = None
+        self._content_keys.clear()
+        self._stream_digests.clear()
+        self._xref_set = None
+        self._display_lists.clear()
+        self._sizes.clear()
+        self.render_cache.clear()
+        self._page_revs.clear()
+        self._touched.clear()
         self.path = None
         self.dirty = False
 
     def rotate_page(self, index: int, degrees: int):
         """
-        Rota la página (múltiplos de 90). Usa asignación directa del entero (pikepdf acepta int).
-        Elimina /Rotate si el resultado es 0 para mantener limpio el diccionario.
+        Rota la página (múltiplos de 90) sobre el documento abierto.
         """
-        if not self._pike_doc:
+        if not self._fitz_doc:
             return
-        if index < 0 or index >= len(self._pike_doc.pages):
+        if index < 0 or index >= self.page_count():
             return
-        page = self._pike_doc.pages[index]
-        page_obj = page.obj
-        try:
-            current = int(page_obj.get('/Rotate', 0))
-        except Exception:
-            current = 0
+        xref = self._fitz_doc.page_xref(index)
+        self._track_command(KeyCommand(self._fitz_doc, xref, "Rotate"))
+        self._touched.add(xref)
+        page = self._fitz_doc.load_page(index)
         # Normalizar a múltiplos de 90
         if degrees % 90 != 0:
             degrees = round(degrees / 90) * 90
-        new = (current + degrees) % 360
-        if new == 0 and '/Rotate' in page_obj:
-            del page_obj['/Rotate']
-        else:
-            page_obj['/Rotate'] = new
-        # Rebuild fitz y registrar historial
-        self._rebuild_fitz()
-
-    def _rebuild_fitz(self):
-        if not self._pike_doc:
-            return
-        buf = io.BytesIO()
-        self._pike_doc.save(buf)
-        buf.seek(0)
-        if self._fitz_doc:
-            self._fitz_doc.close()
-        self._fitz_doc = fitz.open(stream=buf.getvalue(), filetype="pdf")
-        self.dirty = True
-        self._notify_history()
+        page.set_rotation((page.rotation + degrees) % 360)
+        self._fitz_changed()
 
     def insert_blank_page(self, position: int, width: int = 595, height: int = 842):
         """
-        Inserta una página en blanco usando la API correcta de pikepdf.
-        width/height en puntos PDF.
+        Inserta una página en blanco. width/height en puntos PDF.
         """
-        if not self._pike_doc:
+        if not self._fitz_doc:
             return
-        try:
-            from pikepdf import Page, Rectangle
-            blank = Page.new()
-            # Ajustar mediabox
-            try:
-                blank.mediabox = Rectangle(0, 0, width, height)
-            except Exception:
-                # Fallback si Rectangle no está disponible
-                blank.mediabox = [0, 0, width, height]
-        except Exception:
-            # Fallback absoluto: crear un PDF temporal con PyMuPDF y anexar su primera página
-            import fitz, io, pikepdf
-            tmp_doc = fitz.open()
-            tmp_doc.new_page(width=width, height=height)
-            buf = tmp_doc.tobytes()
-            tmp_pdf = pikepdf.Pdf.open(io.BytesIO(buf))
-            blank = tmp_pdf.pages[0]
-
-        if position < 0 or position > len(self._pike_doc.pages):
-            position = len(self._pike_doc.pages)
-        self._pike_doc.pages.insert(position, blank)
-        self._rebuild_fitz()  # reconstruye fitz y notifica historial
+        if position < 0 or position > self.page_count():
+            position = self.page_count()
+        self._track_command(PageTreeCommand(position, inserted=True))
+        self._fitz_doc.new_page(pno=position, width=width, height=height)
+        self._fitz_changed()
 
     def duplicate_page(self, index: int):
-        if not self._pike_doc:
+        if not self._fitz_doc:
             return
-        if index < 0 or index >= len(self._pike_doc.pages):
+        if index < 0 or index >= self.page_count():
             return
-        # pikepdf copia al insertar la misma página
-        page = self._pike_doc.pages[index]
-        self._pike_doc.pages.insert(index + 1, page)
-        self._rebuild_fitz()
+        # Copia completa (contenido y recursos propios) justo después del original
+        to = index + 1 if index + 1 < self.page_count() else -1
+        self._track_command(PageTreeCommand(index + 1, inserted=True))
+        self._fitz_doc.fullcopy_page(index, to)
+        self._fitz_changed()
 
     def replace_page(self, index: int, other_path: str, other_page_index: int = 0):
-        if not self._pike_doc:
-            return
-        if index < 0 or index >= len(self._pike_doc.pages):
+        if not self._fitz_doc:
             return
-        other = pikepdf.Pdf.open(other_path)
-        if other_page_index < 0 or other_page_index >= len(other.pages):
+        if index < 0 or index >= self.page_count():
             return
-        # Sustituir
-        self._pike_doc.pages[index] = other.pages[other_page_index]
-        self._rebuild_fitz()
+        other = fitz.open(other_path)
+        try:
+            if other_page_index < 0 or other_page_index >= other.page_count:
+                return
+            self._track_structure()
+            # Sustituir: insertar la página nueva delante y quitar la antigua
+            self._fitz_doc.insert_pdf(other, from_page=other_page_index,
+                                      to_page=other_page_index, start_at=index)
+            before = self._page_links() if self._fitz_doc.has_links() else {}
+            self._fitz_doc.delete_page(index + 1)
+            self._touch_relinked(before)
+        finally:
+            other.close()
+        self._fitz_changed()
 
     def extract_pages(self, indices: list[int], output_path: str):
-        if not self._pike_doc:
+        pike = self._pike()
+        if not pike:
             return
-        indices = sorted(set(i for i in indices if 0 <= i < len(self._pike_doc.pages)))
+        indices = sorted(set(i for i in indices if 0 <= i < len(pike.pages)))
         if not indices:
             return
         new_pdf = pikepdf.Pdf.new()
         for i in indices:
-            new_pdf.pages.append(self._pike_doc.pages[i])
-        new_pdf.save(output_path)
+            new_pdf.pages.append(pike.pages[i])
+        new_pdf.save(output_path, **COMPACT_SAVE)
 
     def get_page_size(self, index: int):
         if not self._fitz_doc:
             return (0, 0)
-        page = self._fitz_doc.load_page(index)
-        rect = page.rect
+        # Memo por revisión: la vista continua pide el tamaño de todas las páginas
+        xref, rev = self.page_revision(index)
+        memo = self._sizes.get(xref)
+        if memo and memo[0] == rev:
+            return memo[1]
+        rect = self._fitz_doc.load_page(index).rect
+        self._sizes[xref] = (rev, (rect.width, rect.height))
         return (rect.width, rect.height)
 
-    def _sync_from_fitz_bytes(self, buf: io.BytesIO):
-        """Sincroniza ambos objetos desde los bytes proporcionados."""
-        data = buf.getvalue()
-        # Reabrir pikepdf
-        self._pike_doc = pikepdf.Pdf.open(io.BytesIO(data))
-        # Reabrir fitz
-        if self._fitz_doc:
-            try:
-                self._fitz_doc.close()
-            except:
-                pass
-        self._fitz_doc = fitz.open(stream=data, filetype="pdf")
-        self.dirty = True
-        if self._font_manager:
-            self._register_external_fonts()
-
     def add_text(self, page_index: int, x: float, y: float, text: str,
                  font_size: int = 14, color=(0, 0, 0), font_family: str = "helv") -> bool:
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
+        self._track_page(page_index)
         page = self._fitz_doc.load_page(page_index)
         page.insert_text(
             fitz.Point(x, y),
@@ -250,18 +975,14 @@ class DocumentManager:
             fontname=font_family,
             fill=color
         )
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
 
     def draw_filled_rect(self, page_index: int, rect, fill=(1,1,1)):
         """
         rect: (x0,y0,x1,y1) coords página. fill: tupla RGB (0..1).
         """
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
@@ -270,13 +991,10 @@ class DocumentManager:
         if y1 < y0: y0,y1 = y1,y0
         if x1 - x0 <= 0 or y1 - y0 <= 0:
             return False
+        self._track_page(page_index)
         page = self._fitz_doc.load_page(page_index)
         page.draw_rect(fitz.Rect(x0,y0,x1,y1), color=None, fill=fill)
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
 
     def add_text_box(self, page_index: int, rect, text: str,
@@ -288,13 +1006,14 @@ class DocumentManager:
         Inserta texto dentro del rect. Devuelve True solo si realmente se dibuja algo
         (texto o fondo borrado). Corrige lógica para detectar si insert_textbox colocó texto.
         """
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
         x0, y0, x1, y1 = rect
         if x1 < x0: x0, x1 = x1, x0
         if y1 < y0: y0, y1 = y1, y0
+        self._track_page(page_index)
         page = self._fitz_doc.load_page(page_index)
         pw, ph = page.rect.width, page.rect.height
         x0 = max(0, min(pw, x0)); x1 = max(0, min(pw, x1))
@@ -304,6 +1023,7 @@ class DocumentManager:
         if (x1 - x0) < min_w: x1 = x0 + min_w
         if (y1 - y0) < min_h: y1 = y0 + min_h
         if (x1 - x0) <= 0 or (y1 - y0) <= 0:
+            self._drop_failed_edit()
             return False
         placed_any = False
         if erase_background:
@@ -367,41 +1087,40 @@ class DocumentManager:
                 page.draw_line(fitz.Point(x0 + 2, uy), fitz.Point(x1 - 2, uy),
                                color=underline_color, width=0.8)
         if placed_any:
-            buf = io.BytesIO()
-            self._fitz_doc.save(buf)
-            buf.seek(0)
-            self._sync_from_fitz_bytes(buf)
-            self._notify_history()
+            self._fitz_changed()
+        else:
+            self._drop_failed_edit()
         return placed_any
 
     def redact_rect(self, page_index: int, rect, fill=(1,1,1)):
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
         x0,y0,x1,y1 = rect
         if x1 < x0: x0,x1 = x1,x0
         if y1 < y0: y0,y1 = y1,y0
+        self._track_page(page_index)
         page = self._fitz_doc.load_page(page_index)
         page.add_redact_annot(fitz.Rect(x0,y0,x1,y1), fill=fill)
         page.apply_redactions()
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
 
     def add_text_annotation(self, page_index: int, rect, text: str,
                             font_family: str = "helv", font_size: int = 14,
                             color=(0,0,0), underline=False, fill_bg=None) -> Optional[int]:
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return None
         if page_index < 0 or page_index >= self.page_count():
             return None
         x0,y0,x1,y1 = rect
         if x1 < x0: x0,x1 = x1,x0
         if y1 < y0: y0,y1 = y1,y0
+        if underline:
+            self._track_page(page_index)   # la línea va al contenido de la página
+        else:
+            self._track_annots(page_index)
         page = self._fitz_doc.load_page(page_index)
         annot = page.add_freetext_annot(
             fitz.Rect(x0,y0,x1,y1),
@@ -418,11 +1137,7 @@ class DocumentManager:
         if underline:
             baseline_y = y1 - 2
             page.draw_line(fitz.Point(x0+2, baseline_y), fitz.Point(x1-2, baseline_y), color=color, width=0.8)
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return annot.xref
 
     def list_text_annotations(self, page_index: int):
@@ -439,12 +1154,13 @@ class DocumentManager:
     def update_text_annotation(self, page_index: int, xref: int, text: str = None,
                                rect=None, font_family=None, font_size=None,
                                color=None, fill_bg=None, underline=False):
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         page = self._fitz_doc.load_page(page_index)
         annot = page.load_annot(xref)
         if not annot or annot.type[0] != fitz.PDF_ANNOT_FREE_TEXT:
             return False
+        self._track_page(page_index)
         info_changed = False
         if rect:
             x0,y0,x1,y1 = rect
@@ -469,34 +1185,26 @@ class DocumentManager:
         if underline and rect:
             baseline_y = y1 - 2
             page.draw_line(fitz.Point(x0+2, baseline_y), fitz.Point(x1-2, baseline_y), color=color or (0,0,0), width=0.8)
-        # guardar
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return info_changed
 
     def delete_annotation(self, page_index: int, xref: int):
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         page = self._fitz_doc.load_page(page_index)
         annot = page.load_annot(xref)
         if not annot:
             return False
+        self._track_annots(page_index)
         page.delete_annot(annot)
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
 
     def add_highlight_rect(self, page_index: int, rect, color_rgb=(255,255,0), opacity: float = 0.35) -> bool:
         """
         Crea un rectángulo de resaltado semitransparente sin borde visible.
         """
-        if not self._fitz_doc or not self._pike_doc:
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
@@ -505,6 +1213,7 @@ class DocumentManager:
         if y1 < y0: y0,y1 = y1,y0
         if (x1 - x0) <= 0 or (y1 - y0) <= 0:
             return False
+        self._track_annots(page_index)
         page = self._fitz_doc.load_page(page_index)
         r,g,b = (c/255.0 for c in color_rgb)
         annot = page.add_rect_annot(fitz.Rect(x0,y0,x1,y1))
@@ -516,42 +1225,116 @@ class DocumentManager:
         except:
             pass
         annot.update()
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
 
     def set_history(self, history):
         self._history = history
 
     def get_pdf_bytes(self) -> bytes:
-        if not self._pike_doc:
+        if not self._fitz_doc:
             return b""
-        buf = io.BytesIO()
-        self._pike_doc.save(buf)
-        return buf.getvalue()
-
-    def load_from_bytes(self, data: bytes):
-        """Carga estado (para undo/redo) sin registrar nuevo snapshot."""
-        self.close()
-        self._pike_doc = pikepdf.Pdf.open(io.BytesIO(data))
-        self._fitz_doc = fitz.open(stream=data, filetype="pdf")
-        self.dirty = True  # estado modificado
-        if self._font_manager:
-            self._register_external_fonts()
+        return self._fitz_doc.tobytes()
+
+    def _track_page(self, index: int):
+        """Registra el estado previo de una página antes de editarla."""
+        self._command = None
+        if self._fitz_doc:
+            self._touched.add(self._fitz_doc.page_xref(index))
+        if self._history and self._fitz_doc:
+            if self._capture is None:
+                self._capture = DeltaRecorder(self._fitz_doc, self._history.store)
+            self._capture.track_page(index)
+
+    def _track_structure(self):
+        """Registra el estado previo antes de tocar el árbol de páginas."""
+        self._command = None
+        if self._history and self._fitz_doc:
+            if self._capture is None:
+                self._capture = DeltaRecorder(self._fitz_doc, self._history.store)
+            self._capture.track_structure()
+
+    def _track_command(self, command: Command):
+        """
+        Registra una edición que guarda su propia inversa (core/commands.py).
+        El delta abierto, si lo hay, se cierra antes para conservar el orden.
+        """
+        self._command = None
+        if not (self._history and self._fitz_doc):
+            return
+        if self._capture is not None:
+            self._steps.append(self._capture.finish())
+            self._capture = None
+        self._command = command
+
+    def _track_annots(self, page_index: int):
+        """Antes de añadir/quitar anotaciones: basta con el array /Annots."""
+        if self._fitz_doc:
+            xref = self._fitz_doc.page_xref(page_index)
+            self._touched.add(xref)
+            self._track_command(KeyCommand(self._fitz_doc, xref, "Annots"))
+
+    def _drop_failed_edit(self):
+        """
+        Edición que no llegó a cambiar nada. Dentro de una transacción la
+        captura es compartida con las ediciones anteriores: se deja abierta
+        (lo no tocado no entra en el delta); fuera, se suelta.
+        """
+        self._touched.clear()
+        if not self._tx_depth:
+            self._discard_capture()
+
+    def _discard_capture(self):
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.discard()
+        self._command = None
+        if self._history:
+            self._history.store.release(k for s in self._steps for k in s.blob_keys())
+        self._steps = []
 
     def _notify_history(self, initial=False):
         if not self._history:
             return
-        data = self.get_pdf_bytes()
-        if initial and not data:
+        if initial:
+            self._discard_capture()
+            self._history.reset()
             return
-        if initial and self._history:
-            self._history.reset_with(data)
-        else:
-            self._history.push(data)
+        if self._capture is not None:
+            self._steps.append(self._capture.finish())
+            self._capture = None
+        steps, self._steps = [s for s in self._steps if not s.is_empty()], []
+        if steps:
+            self._history.push(steps[0] if len(steps) == 1 else Batch(steps))
+
+    def undo(self) -> bool:
+        """Revierte el último delta sobre el documento abierto (sin reabrirlo)."""
+        if not (self._fitz_doc and self._history) or self._tx_depth:
+            return False
+        if not self._history.can_undo():
+            return False
+        self._discard_capture()  # edición fallida pendiente: no llegó a cambiar nada
+        step = self._history.undo()
+        step.apply(self._fitz_doc, undo=True, fetch=self._history.store.get)
+        self._touch_pages(step.pages)
+        self._drop_pike()
+        self.dirty = True
+        self._edits += 1
+        return True
+
+    def redo(self) -> bool:
+        if not (self._fitz_doc and self._history) or self._tx_depth:
+            return False
+        if not self._history.can_redo():
+            return False
+        self._discard_capture()
+        step = self._history.redo()
+        step.apply(self._fitz_doc, undo=False, fetch=self._history.store.get)
+        self._touch_pages(step.pages)
+        self._drop_pike()
+        self.dirty = True
+        self._edits += 1
+        return True
 
     def set_font_manager(self, font_manager: FontManager):
         """
@@ -591,7 +1374,7 @@ class DocumentManager:
         Inserta una imagen escalándola para caber en el rect (mantiene aspecto).
         rect: (x0,y0,x1,y1) coords página.
         """
-        if not (self._fitz_doc and self._pike_doc):
+        if not self._fitz_doc:
             return False
         if page_index < 0 or page_index >= self.page_count():
             return False
@@ -616,16 +1399,14 @@ class DocumentManager:
         dh = ih * scale
         ox = x0 + (bw - dw)/2
         oy = y0 + (bh - dh)/2
+        self._track_page(page_index)
         page = self._fitz_doc.load_page(page_index)
         try:
             with open(image_path, 'rb') as f:
                 img_bytes = f.read()
             page.insert_image(fitz.Rect(ox, oy, ox+dw, oy+dh), stream=img_bytes)
         except Exception:
+            self._drop_failed_edit()
             return False
-        buf = io.BytesIO()
-        self._fitz_doc.save(buf)
-        buf.seek(0)
-        self._sync_from_fitz_bytes(buf)
-        self._notify_history()
+        self._fitz_changed()
         return True
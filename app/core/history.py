@@ -1,52 +1,320 @@
-from collections import deque
+from collections import OrderedDict, deque
+from typing import Iterable, List, Optional
+import hashlib
+import mmap
+import pickle
+import tempfile
+import zlib
+
+_MB = 1024 * 1024
+
+
+def content_key(data: bytes) -> bytes:
+    """Clave de contenido: blake2b de 128 bits (rápido, sin colisiones prácticas)."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class _SpillFile:
+    """Fichero temporal de solo-añadir; las lecturas van por mmap."""
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='pdfeditor-history-')
+        self._map: Optional[mmap.mmap] = None
+        self.size = 0       # bytes escritos
+        self.live = 0       # bytes aún referenciados
+
+    def write(self, blob: bytes) -> int:
+        offset = self.size
+        self._file.seek(offset)
+        self._file.write(blob)
+        self.size += len(blob)
+        self.live += len(blob)
+        self._drop_map()
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._map is None:
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def free(self, length: int):
+        self.live -= length
+
+    def truncate(self):
+        self._drop_map()
+        self._file.truncate(0)
+        self.size = 0
+        self.live = 0
+
+    def close(self):
+        self._drop_map()
+        self._file.close()
+
+    def _drop_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class _Blob:
+    __slots__ = ('data', 'offset', 'length', 'refs')
+
+    def __init__(self, data: bytes):
+        self.data: Optional[bytes] = data   # None si está volcado a disco
+        self.offset = 0
+        self.length = len(data)
+        self.refs = 0
+
+
+class BlobStore:
+    """
+    Almacén direccionado por contenido con recuento de referencias.
+    Un mismo stream (o delta empaquetado) que se repite entre revisiones se
+    guarda una sola vez. Los blobs menos usados pueden volcarse a disco.
+    """
+    def __init__(self):
+        self._blobs: 'OrderedDict[bytes, _Blob]' = OrderedDict()   # orden LRU
+        self._spill: Optional[_SpillFile] = None
+        self.ram_bytes = 0
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def put(self, data: bytes) -> bytes:
+        """Guarda (o referencia de nuevo) `data` y devuelve su clave."""
+        key = content_key(data)
+        blob = self._blobs.get(key)
+        if blob is None:
+            blob = self._blobs[key] = _Blob(data)
+            self.ram_bytes += blob.length
+        else:
+            self._blobs.move_to_end(key)
+        blob.refs += 1
+        return key
+
+    def get(self, key: bytes) -> bytes:
+        blob = self._blobs[key]
+        self._blobs.move_to_end(key)
+        if blob.data is not None:
+            return blob.data
+        return self._spill.read(blob.offset, blob.length)
+
+    def release(self, keys: Iterable[bytes]):
+        for key in keys:
+            blob = self._blobs.get(key)
+            if blob is None:
+                continue
+            blob.refs -= 1
+            if blob.refs > 0:
+                continue
+            del self._blobs[key]
+            if blob.data is not None:
+                self.ram_bytes -= blob.length
+            elif self._spill:
+                self._spill.free(blob.length)
+
+    def disk_bytes(self) -> int:
+        return self._spill.live if self._spill else 0
+
+    def spilled(self) -> int:
+        return sum(1 for b in self._blobs.values() if b.data is None)
+
+    def spill_until(self, max_ram: int):
+        """Vuelca a disco los blobs menos usados hasta bajar de `max_ram`."""
+        for blob in self._blobs.values():
+            if self.ram_bytes <= max_ram:
+                break
+            if blob.data is None:
+                continue
+            if self._spill is None:
+                self._spill = _SpillFile()
+            blob.offset = self._spill.write(blob.data)
+            blob.data = None
+            self.ram_bytes -= blob.length
+
+    def clear(self):
+        self._blobs.clear()
+        self.ram_bytes = 0
+        if self._spill:
+            self._spill.truncate()
+
+    def compact(self):
+        spill = self._spill
+        if not spill or not spill.size:
+            return
+        if spill.live == 0:
+            spill.truncate()
+            return
+        # Huecos de blobs liberados: reescribir cuando dominen el fichero
+        if spill.size < 8 * _MB or spill.size < 2 * spill.live:
+            return
+        fresh = _SpillFile()
+        for blob in self._blobs.values():
+            if blob.data is None:
+                blob.offset = fresh.write(spill.read(blob.offset, blob.length))
+        spill.close()
+        self._spill = fresh
+
+
+class _Entry:
+    """
+    Un delta del historial: vivo (objeto Delta) o empaquetado (pickle + zlib)
+    en el BlobStore bajo `key`. `refs` son las claves de sus streams.
+    """
+    __slots__ = ('delta', 'key', 'refs')
+
+    def __init__(self, delta):
+        self.delta = delta
+        self.key: Optional[bytes] = None
+        self.refs: List[bytes] = delta.blob_keys()
+
 
 class HistoryManager:
     """
-    Mantiene un historial de snapshots (bytes PDF).
-    Índice apunta al snapshot actual.
+    Mantiene un historial de deltas (cambios por objeto PDF, ver core/delta.py).
+    Cada entrada es la transición entre dos revisiones consecutivas; el
+    documento vivo es la revisión actual. Índice = nº de entradas aplicadas.
+
+    Los streams de los deltas y los deltas empaquetados viven en `store`
+    (BlobStore): el contenido repetido entre revisiones se guarda una vez.
+
+    Política de memoria:
+    - hasta `hot` entradas a cada lado de la revisión actual quedan sin empaquetar;
+    - el resto se comprimen (zlib) en memoria;
+    - si la memoria supera `memory_budget`, los blobs menos usados se vuelcan a
+      un fichero temporal (leído con mmap);
+    - si el disco supera `disk_budget` (o se pasa de `limit` entradas), se
+      descartan las entradas más antiguas.
     """
-    def __init__(self, limit: int = 30):
+    def __init__(self, memory_budget: int = 64 * _MB, disk_budget: int = 512 * _MB,
+                 hot: int = 4, limit: Optional[int] = None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.hot = hot
         self.limit = limit
-        self._stack = deque()   # lista de bytes
-        self._index = -1        # -1 => vacío
+        self.store = BlobStore()
+        self._stack = deque()   # lista de _Entry
+        self._index = 0
+        self.evicted = 0        # entradas descartadas por presupuesto
 
-    def reset_with(self, data: bytes):
+    def reset(self):
         self._stack.clear()
-        self._stack.append(data)
         self._index = 0
+        self.store.clear()
 
-    def push(self, data: bytes):
-        if self._index >= 0 and self._stack and data == self._stack[self._index]:
+    def push(self, delta):
+        """Añade un delta; sus referencias en `store` pasan al historial."""
+        if delta.is_empty():
             return  # sin cambios
         # Truncar redo
-        while len(self._stack) - 1 > self._index:
-            self._stack.pop()
-        self._stack.append(data)
+        while len(self._stack) > self._index:
+            self._release(self._stack.pop())
+        self._stack.append(_Entry(delta))
         self._index += 1
-        # Limitar
-        while len(self._stack) > self.limit:
-            self._stack.popleft()
-            self._index -= 1
+        self._rebalance()
 
     def can_undo(self) -> bool:
         return self._index > 0
 
     def can_redo(self) -> bool:
-        return self._index >= 0 and self._index < len(self._stack) - 1
+        return self._index < len(self._stack)
 
-    def undo(self) -> bytes:
+    def undo(self):
+        """Devuelve el delta a revertir."""
         if not self.can_undo():
             raise RuntimeError("No undo")
         self._index -= 1
-        return self._stack[self._index]
+        self._rebalance()
+        return self._load(self._stack[self._index])
 
-    def redo(self) -> bytes:
+    def redo(self):
+        """Devuelve el delta a reaplicar."""
         if not self.can_redo():
             raise RuntimeError("No redo")
         self._index += 1
-        return self._stack[self._index]
+        self._rebalance()
+        return self._load(self._stack[self._index - 1])
+
+    # ---------- Consultas (UI) ----------
+    def memory_usage(self) -> int:
+        live = sum(e.delta.nbytes() for e in self._stack if e.delta is not None)
+        return live + self.store.ram_bytes
+
+    def disk_usage(self) -> int:
+        return self.store.disk_bytes()
+
+    def stats(self) -> dict:
+        hot = sum(1 for e in self._stack if e.delta is not None)
+        return {
+            'entries': len(self._stack),
+            'index': self._index,
+            'hot': hot,
+            'compressed': len(self._stack) - hot,
+            'blobs': len(self.store),
+            'spilled': self.store.spilled(),
+            'evicted': self.evicted,
+            'memory': self.memory_usage(),
+            'memory_budget': self.memory_budget,
+            'disk': self.disk_usage(),
+            'disk_budget': self.disk_budget,
+            'policy': self.describe_policy(),
+        }
+
+    def describe_policy(self) -> str:
+        limit = f', máx. {self.limit} pasos' if self.limit else ''
+        return (f'{self.hot} pasos a cada lado del actual sin comprimir; resto comprimido en memoria '
+                f'hasta {self.memory_budget // _MB} MB, luego a disco hasta '
+                f'{self.disk_budget // _MB} MB; después se descartan los más antiguos{limit}. '
+                f'El contenido repetido entre pasos se guarda una sola vez.')
+
+    # ---------- Internos ----------
+    def _load(self, entry: _Entry):
+        if entry.delta is not None:
+            return entry.delta
+        return pickle.loads(zlib.decompress(self.store.get(entry.key)))
+
+    def _pack(self, entry: _Entry):
+        if entry.delta is None:
+            return
+        blob = zlib.compress(pickle.dumps(entry.delta, pickle.HIGHEST_PROTOCOL), 1)
+        entry.key = self.store.put(blob)
+        entry.delta = None
+
+    def _unpack(self, entry: _Entry):
+        if entry.delta is not None:
+            return
+        entry.delta = self._load(entry)
+        self.store.release([entry.key])
+        entry.key = None
+
+    def _release(self, entry: _Entry):
+        """Suelta todo lo que la entrada referencia en el almacén."""
+        keys = list(entry.refs)
+        if entry.key is not None:
+            keys.append(entry.key)
+        self.store.release(keys)
+        entry.delta = entry.key = None
+        entry.refs = []
+
+    def _evict_oldest(self):
+        self._release(self._stack.popleft())
+        self._index -= 1
+        self.evicted += 1
 
-    def current(self) -> bytes:
-        if self._index < 0:
-            raise RuntimeError("Empty history")
-        return self._stack[self._index]
\ No newline at end of file
+    def _rebalance(self):
+        # Ventana caliente alrededor del índice actual
+        lo, hi = self._index - self.hot, self._index + self.hot
+        for i, entry in enumerate(self._stack):
+            if lo <= i < hi:
+                self._unpack(entry)
+            else:
+                self._pack(entry)
+        # Presupuesto de memoria: volcar a disco los blobs menos usados
+        live = self.memory_usage() - self.store.ram_bytes
+        self.store.spill_until(max(0, self.memory_budget - live))
+        # Presupuesto de disco / nº de pasos: descartar las más antiguas
+        while self._stack and self._index > 0 and (
+                self.disk_usage() > self.disk_budget
+                or (self.limit and len(self._stack) > self.limit)):
+            self._evict_oldest()
+        self.store.compact()
@@ -0,0 +1,199 @@
+import itertools
+from collections import OrderedDict
+import multiprocessing as mp
+import os
+import queue
+from multiprocessing import shared_memory
+from typing import Hashable, List, Optional, Tuple, Union
+import fitz  # PyMuPDF
+from .render_cache import tile_clip
+
+CHANNELS = 4    # colas de cancelación independientes (vista, miniaturas, exportar...)
+DISPLAY_LISTS = 8   # páginas interpretadas que guarda cada proceso
+EDITED_PAGES = 16   # páginas editadas compartidas a la vez (ver share_page)
+
+
+def default_processes() -> int:
+    """Procesos de render: todos los núcleos menos uno (la UI), hasta 4."""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def _open_shared(source: str, size: Optional[int]) -> fitz.Document:
+    """PDF desde memoria compartida (con `size`) o desde un fichero en disco."""
+    if size is None:
+        return fitz.open(source, filetype="pdf")
+    shm = shared_memory.SharedMemory(name=source)
+    try:
+        return fitz.open(stream=bytes(shm.buf[:size]), filetype="pdf")
+    finally:
+        shm.close()
+
+
+def _worker_main(source: str, size: Optional[int], jobs, results, current):
+    """
+    Proceso de rasterizado: abre su propia copia (solo lectura) del PDF tal y
+    como se abrió y renderiza páginas por xref. Las páginas editadas después
+    llegan como un PDF de una sola página en memoria compartida (`page`).
+    Los trabajos de generaciones anteriores a `current[canal]` se descartan
+    sin renderizar (cancelados).
+    """
+    doc = _open_shared(source, size)
+    pages = {doc.page_xref(i): i for i in range(doc.page_count)}
+    # xref o memoria compartida -> (DisplayList, documento): otro zoom o
+    # tesela no reinterpreta la página
+    lists = OrderedDict()
+    results.put(('ready', None))
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, channel, gen, xref, zoom, tile, page = job
+        key = xref if page is None else page[0]
+        if gen < current[channel] or (page is None and xref not in pages):
+            results.put((job_id, None))
+            continue
+        try:
+            clip = tile_clip(zoom, tile) if tile is not None else None
+            entry = lists.pop(key, None)
+            if entry is None:
+                src = doc if page is None else _open_shared(*page)
+                entry = (src.load_page(0 if page else pages[xref]).get_displaylist(), src)
+            lists[key] = entry
+            dl = entry[0]
+            if len(lists) > DISPLAY_LISTS:
+                lists.popitem(last=False)
+            pix = dl.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, clip=clip)
+            results.put((job_id, (pix.width, pix.height, pix.x, pix.y, pix.samples)))
+        except Exception:
+            results.put((job_id, None))
+    results.cancel_join_thread()    # al cerrar nadie lee ya los resultados
+    doc.close()
+
+
+class RasterWorker:
+    """
+    Rasteriza páginas en otros procesos para no bloquear la UI (PyMuPDF no
+    suelta el GIL, un hilo no serviría) y usar varios núcleos: un grupo de
+    `processes` procesos que toman trabajos de una cola común. Cada uno
+    recibe el PDF original por memoria compartida (o la ruta de la copia en
+    disco, y lo lee bajo demanda): sirve las páginas sin editar desde que se
+    abrió o guardó (ver DocumentManager.pristine_xref). Las editadas se le
+    pasan aparte con share_page, una vez por revisión.
+    """
+    def __init__(self, data: Union[bytes, str], processes: Optional[int] = None):
+        ctx = mp.get_context('spawn')   # fork + Tk no es seguro
+        self._shm = None
+        if isinstance(data, str):
+            source, size = data, None
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            self._shm.buf[:len(data)] = data
+            source, size = self._shm.name, len(data)
+        self._jobs = ctx.Queue()
+        self._results = ctx.Queue()
+        self._current = ctx.Array('i', CHANNELS, lock=False)
+        self._ids = itertools.count(1)
+        self._pages: 'OrderedDict[Hashable, Tuple[shared_memory.SharedMemory, int]]' = OrderedDict()
+        self.pending = {}       # job_id -> canal
+        self._done = [[] for _ in range(CHANNELS)]
+        self.ready = False      # algún proceso ya cargó el documento
+        self._loaded = 0
+        self._procs = [ctx.Process(target=_worker_main, daemon=True,
+                                   args=(source, size, self._jobs,
+                                         self._results, self._current))
+                       for _ in range(processes or default_processes())]
+        for proc in self._procs:
+            proc.start()
+
+    def submit(self, xref: int, zoom: float, gen: int, tile=None, channel: int = 0,
+               page: Optional[Hashable] = None) -> int:
+        """Con `page` (clave de share_page) se renderiza esa copia de la página."""
+        job_id = next(self._ids)
+        self.pending[job_id] = channel
+        shared = None
+        if page is not None:
+            shm, size = self._pages[page]
+            shared = (shm.name, size)
+        self._jobs.put((job_id, channel, gen, xref, zoom, tile, shared))
+        return job_id
+
+    def has_page(self, key: Hashable) -> bool:
+        if key in self._pages:
+            self._pages.move_to_end(key)
+            return True
+        return False
+
+    def share_page(self, key: Hashable, data: bytes):
+        """
+        Deja `data` (PDF de una página) en memoria compartida para los
+        trabajos con page=key. Se guardan las EDITED_PAGES más recientes;
+        un trabajo sobre una ya soltada falla (resultado None).
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        self._pages[key] = (shm, len(data))
+        while len(self._pages) > EDITED_PAGES:
+            self._unlink(self._pages.popitem(last=False)[1][0])
+
+    def cancel_before(self, gen: int, channel: int = 0):
+        """Los trabajos del canal con generación < gen que aún no empezaron se descartan."""
+        self._current[channel] = gen
+
+    def busy(self, channel: int = 0) -> bool:
+        return bool(self._done[channel]) or channel in self.pending.values()
+
+    def poll(self, channel: int = 0) -> List[Tuple[int, Optional[fitz.Pixmap]]]:
+        """Resultados terminados del canal: (job_id, pixmap o None si se canceló/falló)."""
+        while True:
+            try:
+                job_id, res = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if job_id == 'ready':
+                self.ready = True
+                self._loaded += 1
+                if self._loaded == len(self._procs):
+                    self._release_shm()   # todos tienen ya su copia
+                continue
+            ch = self.pending.pop(job_id, 0)
+            if res is not None:
+                w, h, x, y, samples = res
+                res = fitz.Pixmap(fitz.csRGB, w, h, samples, 0)
+                res.set_origin(x, y)
+            self._done[ch].append((job_id, res))
+        out, self._done[channel] = self._done[channel], []
+        return out
+
+    def alive(self) -> bool:
+        # Si muere uno, sus trabajos en curso se pierden: se trata como caído
+        return all(proc.is_alive() for proc in self._procs)
+
+    def close(self, wait: bool = True):
+        """Para los procesos; wait=False no espera a que terminen lo que tengan en curso."""
+        try:
+            for _ in self._procs:
+                self._jobs.put(None)
+            for proc in self._procs if wait else ():
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    proc.terminate()
+        except Exception:
+            pass
+        self._release_shm()
+        for shm, _ in self._pages.values():
+            self._unlink(shm)
+        self._pages.clear()
+        self.pending.clear()
+
+    def _release_shm(self):
+        if self._shm is not None:
+            self._unlink(self._shm)
+            self._shm = None
+
+    @staticmethod
+    def _unlink(shm: shared_memory.SharedMemory):
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+import fitz  # PyMuPDF
+
+_MB = 1024 * 1024
+TILE_SIZE = 512     # lado de tesela en píxeles de pantalla
+
+
+def tile_clip(zoom: float, tile, size: int = TILE_SIZE) -> fitz.Rect:
+    """Rectángulo de página (puntos) que cubre la tesela (tx, ty) a ese zoom."""
+    tx, ty = tile
+    return fitz.Rect(tx * size / zoom, ty * size / zoom,
+                     (tx + 1) * size / zoom, (ty + 1) * size / zoom)
+
+
+def pixmap_nbytes(pix: fitz.Pixmap) -> int:
+    return pix.stride * pix.height
+
+
+class RenderCache:
+    """
+    Caché LRU de pixmaps renderizados, acotada en bytes.
+    La clave la decide quien llama (página, revisión, zoom...); `page` es la
+    identidad de página (xref) para poder descartar todo lo de una página.
+    """
+    def __init__(self, max_bytes: int = 256 * _MB):
+        self.max_bytes = max_bytes
+        self._items: 'OrderedDict[tuple, fitz.Pixmap]' = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, page: int, key: Hashable) -> Optional[fitz.Pixmap]:
+        pix = self._items.get((page, key))
+        if pix is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end((page, key))
+        self.hits += 1
+        return pix
+
+    def put(self, page: int, key: Hashable, pix: fitz.Pixmap):
+        size = pixmap_nbytes(pix)
+        if size > self.max_bytes:
+            return  # no cabe: mejor no vaciar la caché por un solo render
+        old = self._items.pop((page, key), None)
+        if old is not None:
+            self.nbytes -= pixmap_nbytes(old)
+        self._items[(page, key)] = pix
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, victim = self._items.popitem(last=False)
+            self.nbytes -= pixmap_nbytes(victim)
+
+    def page_items(self, page: int):
+        """(clave, pixmap) de una página, sin alterar el orden LRU."""
+        return [(k[1], pix) for k, pix in self._items.items() if k[0] == page]
+
+    def drop_page(self, page: int):
+        for k in [k for k in self._items if k[0] == page]:
+            self.nbytes -= pixmap_nbytes(self._items.pop(k))
+
+    def clear(self):
+        self._items.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
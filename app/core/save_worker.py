@@ -0,0 +1,246 @@
+import io
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+import fitz  # PyMuPDF
+import pikepdf
+
+# pikepdf.save con la salida más pequeña: flujos de objetos y streams recomprimidos
+COMPACT_SAVE = dict(object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                    compress_streams=True, recompress_flate=True)
+
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_COPY_CHUNK = 8 * 1024 * 1024
+
+
+def temp_path(path: str) -> str:
+    """Temporal junto a `path`: mismo sistema de ficheros, así os.replace es atómico."""
+    folder, name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=folder)
+    os.close(fd)
+    return tmp
+
+
+def commit_file(tmp: str, path: str):
+    """
+    Vuelca `tmp` a disco y lo renombra sobre `path`: en el destino queda el
+    fichero anterior o el nuevo completo, nunca uno a medias.
+    """
+    with open(tmp, 'rb+') as f:
+        os.fsync(f.fileno())
+    try:
+        shutil.copymode(path, tmp)
+    except OSError:
+        os.chmod(tmp, 0o666 & ~_UMASK)  # mkstemp crea 0600
+    os.replace(tmp, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+class _TailOutput(fitz.mupdf.FzOutput2):
+    """
+    Salida de MuPDF que se queda solo con lo que un guardado incremental
+    añade tras los `size` bytes del original. Como contenido actual de la
+    salida ofrece el propio original (`source`: bytes o ruta), así MuPDF lo
+    da por copiado y no lo vuelve a escribir.
+    """
+    def __init__(self, source, size: int):
+        super().__init__()
+        self.source, self.size = source, size
+        self.pos = 0
+        self.tail = io.BytesIO()
+        self.use_virtual_write()
+        self.use_virtual_seek()
+        self.use_virtual_tell()
+        self.use_virtual_truncate()
+        self.use_virtual_as_stream()
+
+    def as_stream(self, ctx):
+        if isinstance(self.source, str):
+            return fitz.mupdf.ll_fz_open_file(self.source)
+        return fitz.mupdf.ll_fz_open_memory(fitz.mupdf.python_buffer_data(self.source), self.size)
+
+    def write(self, ctx, data, length):
+        if self.pos < self.size:
+            raise RuntimeError('MuPDF intentó reescribir el original')
+        self.tail.seek(self.pos - self.size)
+        self.tail.write(fitz.mupdf.raw_to_python_bytes(data, length))
+        self.pos += length
+
+    def seek(self, ctx, offset, whence):
+        end = self.size + len(self.tail.getbuffer())
+        self.pos = offset + (0, self.pos, end)[whence]
+
+    def tell(self, ctx):
+        return self.pos
+
+    def truncate(self, ctx):
+        self.tail.truncate(max(0, self.pos - self.size))
+
+
+def incremental_tail(doc: fitz.Document, source, size: int) -> bytes:
+    """
+    Lo que añade un guardado incremental de `doc` (objetos cambiados +
+    xref) a su original de `size` bytes, sin copiar el original: `source`
+    son los bytes de los que se abrió o la ruta de un fichero con ellos.
+    """
+    out = _TailOutput(source, size)
+    opts = fitz.mupdf.PdfWriteOptions()
+    opts.do_incremental = 1
+    fitz.mupdf.pdf_write_document(fitz.mupdf.pdf_specifics(doc.this), out, opts)
+    fitz.mupdf.fz_close_output(out)
+    return out.tail.getvalue()
+
+
+def _fill(snapshot: str, base, size: int):
+    """
+    Copia los `size` primeros bytes de `base` (bytes/memoryview o fichero
+    abierto en binario) al principio de `snapshot`, sobre el hueco que
+    dejó el guardado incremental.
+    """
+    with open(snapshot, 'r+b') as out:
+        if not hasattr(base, 'read'):
+            out.write(memoryview(base)[:size])
+            return
+        base.seek(0)
+        while size > 0:
+            chunk = base.read(min(_COPY_CHUNK, size))
+            if not chunk:
+                raise EOFError('El original es más corto de lo esperado')
+            out.write(chunk)
+            size -= len(chunk)
+
+
+def _remove(path: Optional[str]):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _transform_main(src: str, dst: str, mode: str, linearize: bool, messages):
+    """
+    Proceso de guardado: reescribe la instantánea `src` en `dst` según `mode`:
+    'compact'  fitz sin objetos huérfanos y con deflate, sin renumerar;
+    'pike'     reescritura con pikepdf (Guardar como...);
+    'optimize' duplicados fusionados, recursos sin uso fuera, flujos de
+               objetos y linealizado opcional.
+    Avisa del avance por `messages` como ('progress', 0..100).
+    """
+    def progress(pct, lo=0, hi=100):
+        messages.put(('progress', lo + (hi - lo) * pct / 100))
+    try:
+        if mode == 'pike':
+            with pikepdf.Pdf.open(src) as pdf:
+                pdf.save(dst, progress=progress)
+        elif mode == 'compact':
+            with fitz.open(src) as doc:
+                doc.save(dst, garbage=1, deflate=True)
+        else:
+            with fitz.open(src) as doc:
+                data = doc.tobytes(garbage=3, deflate=True)
+            progress(30)
+            with pikepdf.Pdf.open(io.BytesIO(data)) as pdf:
+                pdf.remove_unreferenced_resources()
+                pdf.save(dst, linearize=linearize, progress=lambda p: progress(p, 30),
+                         **COMPACT_SAVE)
+        messages.put(('done', None))
+    except Exception as e:
+        messages.put(('error', str(e) or type(e).__name__))
+
+
+class SaveJob:
+    """
+    Guardado en segundo plano de una instantánea ya escrita en un temporal
+    junto al destino (DocumentManager.start_save). Sin `mode` solo queda
+    fsync + rename; con `mode` un proceso la reescribe antes (pikepdf y
+    PyMuPDF no sueltan el GIL: en un hilo la UI seguiría congelada).
+    Con `base`, la instantánea es un guardado incremental que solo lleva
+    el final (objetos cambiados + xref) tras un hueco de `base_size` bytes:
+    el hilo copia ahí el original (`base`, ver _fill) y lo cierra si es un
+    fichero. Un hilo lleva el trabajo; el hilo principal consulta
+    progress/done/error.
+    """
+    def __init__(self, snapshot: str, path: str, mode: Optional[str] = None,
+                 linearize: bool = False, base=None, base_size: int = 0, **info):
+        self.path = path
+        self.mode = mode
+        self.linearize = linearize
+        self.info = info            # datos del llamante (estado del documento al tomar la instantánea)
+        self.progress = 0.0         # 0..1
+        self.done = False
+        self.error: Optional[str] = None
+        self.seconds = 0.0
+        self._t0 = time.perf_counter()
+        self._snapshot = snapshot
+        self._base = base
+        self._base_size = base_size
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._thread.join(timeout)
+        return self.done
+
+    def _run(self):
+        out = None
+        try:
+            if self._base is not None:
+                _fill(self._snapshot, self._base, self._base_size)
+            if self.mode is None:
+                out, self._snapshot = self._snapshot, None
+            else:
+                out = temp_path(self.path)
+                self._transform(out)
+            commit_file(out, self.path)
+            out = None
+            self.progress = 1.0
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            if hasattr(self._base, 'close'):
+                self._base.close()
+            self._base = None
+            _remove(out)
+            _remove(self._snapshot)
+            self.seconds = time.perf_counter() - self._t0
+            self.done = True
+
+    def _transform(self, out: str):
+        ctx = mp.get_context('spawn')   # fork + Tk no es seguro
+        messages = ctx.Queue()
+        proc = ctx.Process(target=_transform_main, daemon=True,
+                           args=(self._snapshot, out, self.mode, self.linearize, messages))
+        proc.start()
+        try:
+            while True:
+                try:
+                    kind, value = messages.get(timeout=0.5)
+                except queue.Empty:
+                    if not proc.is_alive():
+                        raise RuntimeError('El proceso de guardado terminó inesperadamente')
+                    continue
+                if kind == 'progress':
+                    self.progress = min(value, 99) / 100
+                elif kind == 'error':
+                    raise RuntimeError(value)
+                else:
+                    break
+        finally:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
@@ -0,0 +1,98 @@
+import os
+import sys
+from typing import Dict, Optional
+import fitz  # PyMuPDF
+
+_MB = 1024 * 1024
+
+
+def default_cache_dir(name: str = 'thumbs') -> str:
+    """Carpeta de caché del usuario según la plataforma."""
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'pdf-editor', name)
+
+
+class ThumbnailCache:
+    """
+    Miniaturas en disco (PNG), una por clave de contenido de página
+    (DocumentManager.page_content_key) y zoom. Acotada en bytes: al pasarse
+    se borran las de uso más antiguo (mtime, que se renueva al leer).
+    Los fallos de disco se ignoran: la caché es solo una ayuda.
+    """
+    def __init__(self, root: Optional[str] = None, max_bytes: int = 64 * _MB):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._sizes: Optional[Dict[str, int]] = None    # nombre -> bytes (se lee al primer uso)
+        self.nbytes = 0
+
+    def get(self, key: str, zoom: float) -> Optional[fitz.Pixmap]:
+        path = os.path.join(self.root, self._name(key, zoom))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return fitz.Pixmap(data)
+        except Exception:
+            return None
+
+    def put(self, key: str, zoom: float, pix: fitz.Pixmap):
+        name = self._name(key, zoom)
+        try:
+            self._scan()
+            if name in self._sizes:
+                return  # misma clave = misma imagen
+            data = pix.tobytes('png')
+            tmp = os.path.join(self.root, name + '.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.root, name))
+        except (OSError, RuntimeError, ValueError):
+            return
+        self.nbytes += len(data) - self._sizes.get(name, 0)
+        self._sizes[name] = len(data)
+        if self.nbytes > self.max_bytes:
+            self._evict()
+
+    def clear(self):
+        self._scan()
+        for name in list(self._sizes):
+            self._remove(name)
+
+    # ---------- Internos ----------
+    @staticmethod
+    def _name(key: str, zoom: float) -> str:
+        return f'{key}-{round(zoom * 1000)}.png'
+
+    def _scan(self):
+        if self._sizes is not None:
+            return
+        self._sizes = {}
+        os.makedirs(self.root, exist_ok=True)
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.png') and entry.is_file():
+                self._sizes[entry.name] = entry.stat().st_size
+        self.nbytes = sum(self._sizes.values())
+
+    def _evict(self):
+        # Deja margen (90 %) para no barrer el directorio en cada put
+        def mtime(name):
+            try:
+                return os.path.getmtime(os.path.join(self.root, name))
+            except OSError:
+                return 0
+        for name in sorted(self._sizes, key=mtime):
+            if self.nbytes <= self.max_bytes * 0.9:
+                break
+            self._remove(name)
+
+    def _remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except OSError:
+            pass
+        self.nbytes -= self._sizes.pop(name, 0)
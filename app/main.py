@@ -39,4 +39,6 @@ def main():
     root.mainloop()
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()  # procesos de render en el ejecutable empaquetado
     main()
@@ -1,15 +1,19 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog, colorchooser
+from tkinter import filedialog, messagebox, simpledialog, colorchooser, ttk
 from .thumbnail_panel import ThumbnailPanel
 from ..core.doc_manager import DocumentManager
 from ..core.history import HistoryManager
+from ..core.thumb_cache import ThumbnailCache
 from .page_view import PageView
+from .render_scheduler import RenderScheduler
+from .photo import pixmap_image
 from .menus import MenusBuilder
 from .tools.text_tool import TextTool
 from .tools.highlight_tool import HighlightTool
 from .tools.image_tool import ImageTool
 import tkinter.font as tkfont
 from ..core.font_manager import FontManager
+from contextlib import contextmanager
 import os
 
 class MainWindow(tk.Frame):
@@ -19,18 +23,29 @@ class MainWindow(tk.Frame):
     def __init__(self, master):
         super().__init__(master)
         self.master = master
+        DocumentManager.remove_stale_backings()   # copias de sesiones anteriores que no cerraron
         self.doc = DocumentManager()
-        self.history = HistoryManager(limit=40)
+        self.history = HistoryManager(memory_budget=128 * 1024 * 1024)
         self.doc.set_history(self.history)
+        self._batch_depth = 0
         self.pack(fill='both', expand=True)
 
         self.rowconfigure(1, weight=1)
         self.columnconfigure(1, weight=1)
 
         # Panel miniaturas y vista (fila 1)
-        self.thumb_panel = ThumbnailPanel(self, on_select=self._on_select_page)
+        self.render_scheduler = RenderScheduler(self, self.doc)
+        self.thumb_scheduler = RenderScheduler(self, self.doc, prefetch=0, channel=1)
+        self.thumb_cache = ThumbnailCache()
+        self.export_scheduler = RenderScheduler(self, self.doc, prefetch=0, channel=2, cache=False)
+        self.thumb_panel = ThumbnailPanel(self, on_select=self._on_select_page,
+                                          request_thumbs=self._request_thumbs)
         self.thumb_panel.grid(row=1, column=0, sticky='ns')
-        self.page_view = PageView(self, self._get_pixmap, self._page_count)
+        self.page_view = PageView(self, self._get_pixmap, self._page_count,
+                                  scheduler=self.render_scheduler,
+                                  get_page_size=self.doc.get_page_size)
+        self.page_view.on_page_change = self._on_view_page_change
+        self.continuous_var = tk.BooleanVar(value=False)
         self.page_view.grid(row=1, column=1, sticky='nsew')
 
         # Inicializar atributos de estilo (usados por ribbon)
@@ -83,6 +98,18 @@ class MainWindow(tk.Frame):
                                    label='Zoom (%)')
         self.zoom_scale.grid(row=2, column=0, columnspan=2, sticky='ew')
 
+        # Barra de guardado en segundo plano (oculta si no hay ninguno)
+        self._save_job = None
+        self._opening = None    # (open_steps, ventana, barra) mientras se abre un PDF
+        self.status_bar = tk.Frame(self, bd=1, relief='sunken')
+        self.save_status = tk.Label(self.status_bar, anchor='w')
+        self.save_status.pack(side='left', fill='x', expand=True, padx=4)
+        self.save_bar = ttk.Progressbar(self.status_bar, length=160, maximum=100)
+        self.save_bar.pack(side='right', padx=4, pady=2)
+        self.status_bar.grid(row=3, column=0, columnspan=2, sticky='ew')
+        self.status_bar.grid_remove()
+        self.master.protocol('WM_DELETE_WINDOW', self._on_close)
+
         # Menús
         MenusBuilder(self.master).build(
             self.open_pdf, self.insert_pdf, self.save_pdf, self.save_as_pdf,
@@ -92,7 +119,13 @@ class MainWindow(tk.Frame):
             self._zoom_reset, self._fit_width,
             lambda: self._rotate(90), lambda: self._rotate(-90),
             lambda: self._move_page(-1), lambda: self._move_page(1),
-            self._undo_action, self._redo_action
+            self._undo_action, self._redo_action,
+            on_history_info=self._show_history_info,
+            on_export_all=self.export_all_pages_images,
+            on_save_compact=self.save_compact_pdf,
+            on_save_optimized=self.save_optimized_pdf,
+            on_toggle_continuous=self._toggle_continuous, continuous_var=self.continuous_var,
+            on_quit=self._on_close
         )
 
         # Wheel
@@ -194,63 +227,189 @@ class MainWindow(tk.Frame):
     def open_pdf(self):
         path = filedialog.askopenfilename(filetypes=[('PDF','*.pdf')])
         if not path: return
+        if self._opening is not None and not self._opening[1].winfo_exists():
+            # El anterior ya se muestra (solo quedaba indexar): se termina
+            for _ in self._opening[0]:
+                pass
+            self._opening = None
+        self._cancel_open()
+        # Por etapas (DocumentManager.open_steps): la lectura va en un hilo,
+        # la página 1 se muestra en cuanto hay documento y el resto después
+        win = tk.Toplevel(self)
+        win.title('Abriendo')
+        win.transient(self.master)
+        tk.Label(win, text=os.path.basename(path), padx=30, pady=10).pack()
+        bar = ttk.Progressbar(win, length=240, maximum=100)
+        bar.pack(padx=20)
+        tk.Button(win, text='Cancelar', command=self._cancel_open).pack(pady=10)
+        win.protocol('WM_DELETE_WINDOW', self._cancel_open)
+        win.grab_set()  # el documento anterior no cambia mientras se lee el nuevo
+        self._opening = (self.doc.open_steps(path), win, bar)
+        self.after_idle(self._open_step)
+
+    def _open_step(self):
+        if self._opening is None:
+            return
+        steps, win, bar = self._opening
         try:
-            self.doc.open(path)
+            stage, done = next(steps)
+        except StopIteration:
+            self._opening = None
+            self._refresh_thumbs()  # miniaturas al final: ya pueden ir a los procesos de render
+            return
         except Exception as e:
+            self._cancel_open()
             messagebox.showerror('Error', f'No se pudo abrir: {e}')
             return
-        self._refresh_thumbs()
+        if stage == 'read':
+            bar['value'] = done * 100
+            self.after(50, self._open_step)
+            return
+        if stage == 'ready':
+            win.destroy()
+            self.thumb_panel.clear()
+            self.page_view.show_document()
+        self.after_idle(self._open_step)
+
+    def _cancel_open(self):
+        """Antes de tener documento deja el anterior; después, cierra el nuevo."""
+        if self._opening is None:
+            return
+        steps, win, _ = self._opening
+        self._opening = None
+        steps.close()
+        if win.winfo_exists():
+            win.destroy()
+        if not self.doc.is_open():
+            self.page_view.show_document()
+            self._refresh_thumbs()
 
     def insert_pdf(self):
-        p = filedialog.askopenfilename(filetypes=[('PDF','*.pdf')])
-        if not p: return
+        paths = filedialog.askopenfilenames(filetypes=[('PDF','*.pdf')])
+        if not paths: return
+        # Todos de una pasada: un paso de historial, fuentes e imágenes compartidas
+        win = tk.Toplevel(self)
+        win.title('Insertando')
+        win.transient(self.master)
+        label = tk.Label(win, text=f'0 / {len(paths)}', padx=30, pady=10)
+        label.pack()
+        win.grab_set()
+
+        def progress(done, total):
+            label.config(text=f'{done} / {total}')
+            win.update_idletasks()
         try:
-            self.doc.insert_pdf(p)
+            self.doc.insert_pdfs(paths, progress=progress)
         except Exception as e:
             messagebox.showerror('Error', f'No se pudo insertar: {e}')
-            return
+        finally:
+            win.destroy()
+        if self.doc.page_count():
+            self.page_view.reload_pages(self.page_view.current_index or 0)
         self._refresh_thumbs()
 
     def save_pdf(self):
         if not self.doc.is_open(): return
-        try:
-            if not self.doc.path: return self.save_as_pdf()
-            self.doc.save()
-            messagebox.showinfo('OK','Guardado')
-        except Exception as e:
-            messagebox.showerror('Error', str(e))
+        if not self.doc.path: return self.save_as_pdf()
+        self._start_save(self.doc.path)
+
+    def save_compact_pdf(self):
+        """Reescribe el fichero entero (sin revisiones incrementales acumuladas)."""
+        if not self.doc.is_open(): return
+        if not self.doc.path: return self.save_as_pdf()
+        self._start_save(self.doc.path, 'compact')
+
+    def save_optimized_pdf(self):
+        if not self.doc.is_open(): return
+        p = filedialog.asksaveasfilename(defaultextension='.pdf')
+        if not p: return
+        linearize = messagebox.askyesno('Guardar optimizado',
+                                        '¿Linealizar (vista rápida de la primera página en la web)?')
+
+        def report(job):
+            r = self.doc.save_report(job)
+            before = f"{r['before'] / 1024:.0f} KB" if r['before'] else '?'
+            messagebox.showinfo('Guardado', f"{p}\nAntes: {before}  Después: {r['after'] / 1024:.0f} KB\n"
+                                            f"Tiempo: {r['seconds']:.2f} s")
+        self._start_save(p, 'optimize', linearize, on_done=report)
 
     def save_as_pdf(self):
         if not self.doc.is_open(): return
         p = filedialog.asksaveasfilename(defaultextension='.pdf')
         if not p: return
+        self._start_save(p, 'pike')
+
+    # ---------- Guardado en segundo plano ----------
+    def _start_save(self, path, mode=None, linearize=False, on_done=None):
+        """
+        Toma la instantánea y sigue en segundo plano (DocumentManager.start_save):
+        se puede seguir editando; el progreso va en la barra inferior.
+        """
+        if self._save_job is not None:
+            messagebox.showinfo('Guardar', 'Ya hay un guardado en curso')
+            return
         try:
-            self.doc.save_as(p)
-            messagebox.showinfo('OK','Guardado')
+            job = self.doc.start_save(path, mode, linearize)
         except Exception as e:
             messagebox.showerror('Error', str(e))
+            return
+        self._save_job = (job, on_done)
+        self.save_status.config(text=f'Guardando {os.path.basename(path)}...')
+        self.save_bar['value'] = 0
+        self.status_bar.grid()
+        self.after(100, self._poll_save)
+
+    def _poll_save(self):
+        job, on_done = self._save_job
+        self.save_bar['value'] = job.progress * 100
+        if not job.done:
+            self.after(100, self._poll_save)
+            return
+        self._save_job = None
+        if not self.doc.finish_save(job):
+            self.status_bar.grid_remove()
+            messagebox.showerror('Error', f'No se pudo guardar {job.path}: {job.error}')
+            return
+        self.save_status.config(text=f'Guardado {os.path.basename(job.path)} ({job.seconds:.1f} s)')
+        self.after(3000, self._hide_save_status)
+        if on_done:
+            on_done(job)
+
+    def _hide_save_status(self):
+        if self._save_job is None:
+            self.status_bar.grid_remove()
+
+    def _on_close(self):
+        # Cerrar a mitad dejaría el fichero anterior intacto, pero sin lo guardado: se espera
+        if self._save_job is not None:
+            self.save_status.config(text='Terminando de guardar...')
+            self.update_idletasks()
+            self._save_job[0].wait()
+        self._cancel_open()
+        self.doc.close()    # borra la copia en disco de low_memory
+        self.master.destroy()
 
     def delete_current_page(self):
         idx = self.page_view.current_index
         if idx is None: return
         if not messagebox.askyesno('Confirmar','Eliminar página?'): return
         self.doc.remove_page(idx)
-        self.page_view.set_page(None) if self.doc.page_count()==0 else self.page_view.set_page( min(idx, self.doc.page_count()-1) )
+        self.page_view.reload_pages(None if self.doc.page_count()==0 else min(idx, self.doc.page_count()-1))
         self._refresh_thumbs()
 
     def insert_blank_page(self):
         idx = self.page_view.current_index
         pos = self.doc.page_count() if idx is None else idx + 1
         self.doc.insert_blank_page(pos)
+        self.page_view.reload_pages(pos)
         self._refresh_thumbs()
-        self.page_view.set_page(pos)
 
     def duplicate_current_page(self):
         idx = self.page_view.current_index
         if idx is None: return
         self.doc.duplicate_page(idx)
+        self.page_view.reload_pages(idx+1)
         self._refresh_thumbs()
-        self.page_view.set_page(idx+1)
 
     def replace_current_page(self):
         idx = self.page_view.current_index
@@ -278,12 +437,40 @@ class MainWindow(tk.Frame):
                                            filetypes=[('PNG','*.png'),('JPEG','*.jpg')])
         if not out: return
         pix = self.doc.get_page_pixmap(idx, max(self.page_view.zoom, 1.5))
-        from PIL import Image
-        img = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
-        mode = 'PNG' if out.lower().endswith('.png') else 'JPEG'
-        img.save(out, mode)
+        pixmap_image(pix).save(out, 'PNG' if out.lower().endswith('.png') else 'JPEG')
         messagebox.showinfo('Exportado', out)
 
+    def export_all_pages_images(self):
+        """Todas las páginas a PNG en una carpeta; el render se reparte entre los procesos."""
+        if not self.doc.is_open(): return
+        folder = filedialog.askdirectory(title='Carpeta de destino')
+        if not folder: return
+        count = self.doc.page_count()
+        zoom = max(self.page_view.zoom, 1.5)
+        base = os.path.splitext(os.path.basename(self.doc.path or 'pagina'))[0]
+        win = tk.Toplevel(self)
+        win.title('Exportando')
+        win.transient(self.master)
+        label = tk.Label(win, text=f'0 / {count}', padx=30, pady=10)
+        label.pack()
+        done = set()
+
+        def cancel():
+            self.export_scheduler.cancel()
+            win.destroy()
+        tk.Button(win, text='Cancelar', command=cancel).pack(pady=(0, 10))
+        win.protocol('WM_DELETE_WINDOW', cancel)
+        win.grab_set()  # modal: las páginas no cambian mientras se exporta
+
+        def save(index, pix):
+            pixmap_image(pix).save(os.path.join(folder, f'{base}_{index + 1:04d}.png'), 'PNG', compress_level=1)
+            done.add(index)
+            label.config(text=f'{len(done)} / {count}')
+            if len(done) == count:
+                win.destroy()
+                messagebox.showinfo('Exportado', folder)
+        self.export_scheduler.request_pages([(i, zoom) for i in range(count)], save)
+
     def _rotate(self, deg):
         idx = self.page_view.current_index
         if idx is None: return
@@ -297,11 +484,9 @@ class MainWindow(tk.Frame):
         new_idx = idx + delta
         if not (0 <= new_idx < self.doc.page_count()):
             return
-        order = list(range(self.doc.page_count()))
-        order[idx], order[new_idx] = order[new_idx], order[idx]
-        self.doc.reorder_pages(order)
+        self.doc.move_page(idx, new_idx)
+        self.page_view.reload_pages(new_idx)
         self._refresh_thumbs()
-        self.page_view.set_page(new_idx)
 
     # ---------- Zoom ----------
     def _zoom_btn(self, factor):
@@ -318,9 +503,9 @@ class MainWindow(tk.Frame):
 
     def _on_zoom_scale(self, _v):
         if self.page_view.current_index is None: return
-        self.page_view.zoom_mode = 'custom'
-        self.page_view.zoom = self.zoom_var.get()/100.0
-        self.page_view.render()
+        target = self.zoom_var.get()/100.0
+        if abs(target - self.page_view.zoom) < 1e-3: return  # eco de _sync_zoom_scale
+        self.page_view.zoom_to(target)
 
     def _sync_zoom_scale(self):
         target = round(self.page_view.zoom*100,2)
@@ -335,24 +520,48 @@ class MainWindow(tk.Frame):
         return self.doc.page_count()
 
     def _refresh_thumbs(self):
-        self.thumb_panel.clear()
         if not self.doc.is_open():
+            self.thumb_panel.clear()
             return
-        for i in range(self.doc.page_count()):
-            pix = self.doc.get_page_pixmap(i, zoom=0.12)
-            from PIL import Image, ImageTk
-            img = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
-            photo = ImageTk.PhotoImage(img)
-            self.thumb_panel.add_thumbnail(i, photo)
+        # Solo se actualizan las filas de páginas cambiadas/insertadas/movidas
+        self.thumb_panel.apply_changes(self.doc.page_changes())
         if self.doc.page_count()>0:
             if self.page_view.current_index is None or self.page_view.current_index >= self.doc.page_count():
                 self.page_view.set_page(0)
             self.thumb_panel.select(self.page_view.current_index)
 
+    def _request_thumbs(self, indices, callback):
+        panel = self.thumb_panel
+        pages = []
+        keys = {}
+        for i in indices:
+            w, h = self.doc.get_page_size(i)
+            zoom = min(panel.THUMB_W / w, panel.THUMB_H / h) if w and h else 0.12
+            # Caché en disco por contenido: reabrir un PDF no vuelve a renderizar
+            keys[i] = (self.doc.page_content_key(i), zoom)
+            pix = self.thumb_cache.get(*keys[i])
+            if pix is not None:
+                callback(i, pix)
+            else:
+                pages.append((i, zoom))
+
+        def rendered(i, pix):
+            self.thumb_cache.put(*keys[i], pix)
+            callback(i, pix)
+        self.thumb_scheduler.request_pages(pages, rendered)
+
     def _on_select_page(self, index: int):
         self.page_view.set_page(index)
         self.thumb_panel.select(index)
 
+    def _on_view_page_change(self, index: int):
+        # Modo continuo: al desplazarse cambia la página actual
+        self.thumb_panel.select(index)
+
+    def _toggle_continuous(self):
+        self.page_view.set_continuous(self.continuous_var.get())
+        self._sync_zoom_scale()
+
     # ---------- Eventos wheel ----------
     def _on_wheel(self, e):
         if self.page_view.canvas.yview() == (0.0,1.0): return
@@ -367,10 +576,32 @@ class MainWindow(tk.Frame):
         """
         Re-renderiza la página actual tras un cambio (añadir texto, etc.)
         y refresca las miniaturas para reflejar el estado actualizado.
+        Dentro de transaction() se aplaza hasta el final del lote.
         """
-        self.page_view.render()
+        if self._batch_depth:
+            return
+        n = self.doc.page_count()
+        if self.page_view.current_index is not None and self.page_view.current_index >= n:
+            # Deshacer una inserción: la página actual ya no existe
+            self.page_view.reload_pages(n - 1 if n else None)
+        else:
+            self.page_view.render()
         self._refresh_thumbs()
 
+    @contextmanager
+    def transaction(self):
+        """
+        Lote de ediciones: un solo snapshot de historial y un solo refresco de UI.
+        """
+        self._batch_depth += 1
+        try:
+            with self.doc.transaction():
+                yield self.doc
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._after_doc_change()
+
     # ---------- Text style collection ----------
     def _collect_text_style(self):
         base_map = {'Helvetica':'helv','Times':'times','Courier':'cour'}
@@ -439,13 +670,20 @@ class MainWindow(tk.Frame):
         return (self.highlight_color_rgb, self.highlight_opacity.get())
 
     def _undo_action(self, event=None):
-        if self.history.can_undo():
-            data = self.history.undo()
-            self.doc.load_from_bytes(data)
+        if self.doc.undo():
             self._after_doc_change()
 
     def _redo_action(self, event=None):
-        if self.history.can_redo():
-            data = self.history.redo()
-            self.doc.load_from_bytes(data)
+        if self.doc.redo():
             self._after_doc_change()
+
+    def _show_history_info(self):
+        st = self.history.stats()
+        mb = lambda n: f'{n / (1024 * 1024):.1f} MB'
+        messagebox.showinfo('Historial',
+            f"Pasos: {st['entries']} (actual {st['index']})\n"
+            f"Sin comprimir: {st['hot']}  Comprimidos: {st['compressed']}  En disco: {st['spilled']}\n"
+            f"Descartados: {st['evicted']}  Blobs únicos: {st['blobs']}\n"
+            f"Memoria: {mb(st['memory'])} / {mb(st['memory_budget'])}\n"
+            f"Disco: {mb(st['disk'])} / {mb(st['disk_budget'])}\n\n"
+            f"{st['policy']}")
@@ -13,7 +13,9 @@ class MenusBuilder:
               on_replace_page, on_extract_page, on_export_img,
               on_zoom_in, on_zoom_out, on_zoom_reset, on_fit_width,
               on_rotate_cw, on_rotate_ccw, on_move_up, on_move_down,
-              on_undo, on_redo):
+              on_undo, on_redo, on_history_info=None, on_export_all=None,
+              on_toggle_continuous=None, continuous_var=None, on_save_compact=None,
+              on_save_optimized=None, on_quit=None):
         menubar = tk.Menu(self.master)
 
         file_menu = tk.Menu(menubar, tearoff=0)
@@ -22,13 +24,19 @@ class MenusBuilder:
         file_menu.add_separator()
         file_menu.add_command(label='Guardar', command=on_save)
         file_menu.add_command(label='Guardar como...', command=on_save_as)
+        if on_save_compact:
+            file_menu.add_command(label='Guardar compactado', command=on_save_compact)
+        if on_save_optimized:
+            file_menu.add_command(label='Guardar optimizado...', command=on_save_optimized)
         file_menu.add_separator()
-        file_menu.add_command(label='Salir', command=self.master.destroy)
+        file_menu.add_command(label='Salir', command=on_quit or self.master.destroy)
         menubar.add_cascade(label='Archivo', menu=file_menu)
 
         edit_menu = tk.Menu(menubar, tearoff=0)
         edit_menu.add_command(label='Deshacer', command=on_undo, accelerator='Ctrl+Z')
         edit_menu.add_command(label='Rehacer', command=on_redo, accelerator='Ctrl+Y')
+        if on_history_info:
+            edit_menu.add_command(label='Historial (memoria)...', command=on_history_info)
         edit_menu.add_separator()
         edit_menu.add_command(label='Eliminar página', command=on_delete_page)
         edit_menu.add_command(label='Duplicar página', command=on_duplicate)
@@ -37,6 +45,8 @@ class MenusBuilder:
         edit_menu.add_separator()
         edit_menu.add_command(label='Extraer página...', command=on_extract_page)
         edit_menu.add_command(label='Exportar página como imagen...', command=on_export_img)
+        if on_export_all:
+            edit_menu.add_command(label='Exportar todas las páginas como imágenes...', command=on_export_all)
         menubar.add_cascade(label='Edición', menu=edit_menu)
 
         view_menu = tk.Menu(menubar, tearoff=0)
@@ -45,6 +55,10 @@ class MenusBuilder:
         view_menu.add_separator()
         view_menu.add_command(label='100%', command=on_zoom_reset)
         view_menu.add_command(label='Ajustar ancho', command=on_fit_width)
+        if on_toggle_continuous:
+            view_menu.add_separator()
+            view_menu.add_checkbutton(label='Desplazamiento continuo', variable=continuous_var,
+                                      command=on_toggle_continuous)
         menubar.add_cascade(label='Ver', menu=view_menu)
 
         page_menu = tk.Menu(menubar, tearoff=0)
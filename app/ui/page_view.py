@@ -1,6 +1,9 @@
+import bisect
+import math
 import tkinter as tk
-from typing import Optional, Protocol, Tuple, Callable
-from PIL import Image, ImageTk
+from typing import Dict, Optional, Protocol, Tuple, Callable
+from .photo import pixmap_photo, scaled_photo
+from ..core.render_cache import TILE_SIZE
 
 class Tool(Protocol):
     def on_mouse_down(self, event): ...
@@ -13,14 +16,23 @@ class PageView(tk.Frame):
     """
     Responsabilidad: mostrar la página PDF, gestionar zoom, scroll y delegar eventos al Tool activo.
     """
-    def __init__(self, master, get_page_pixmap: Callable, get_page_count: Callable):
+    # A partir de este tamaño (píxeles) se renderiza por teselas visibles
+    TILE_THRESHOLD = 6_000_000
+    TILE_MARGIN = 256   # píxeles de margen alrededor de la vista
+    ZOOM_SETTLE_MS = 150  # sin cambios de zoom durante este tiempo => render nítido
+    PAGE_GAP = 12       # separación entre páginas en modo continuo
+
+    def __init__(self, master, get_page_pixmap: Callable, get_page_count: Callable,
+                 scheduler=None, get_page_size: Optional[Callable] = None):
         super().__init__(master, bg='gray')
         self.get_page_pixmap = get_page_pixmap
         self.get_page_count = get_page_count
+        self.scheduler = scheduler  # RenderScheduler opcional (render en segundo plano)
+        self.get_page_size = get_page_size
         self.canvas = tk.Canvas(self, bg='gray')
         self.v_scroll = tk.Scrollbar(self, orient='vertical', command=self.canvas.yview)
         self.h_scroll = tk.Scrollbar(self, orient='horizontal', command=self.canvas.xview)
-        self.canvas.configure(yscrollcommand=self.v_scroll.set, xscrollcommand=self.h_scroll.set)
+        self.canvas.configure(yscrollcommand=self._on_yscroll, xscrollcommand=self._on_xscroll)
         self.canvas.grid(row=0, column=0, sticky='nsew')
         self.v_scroll.grid(row=0, column=1, sticky='ns')
         self.h_scroll.grid(row=1, column=0, sticky='ew')
@@ -34,6 +46,20 @@ class PageView(tk.Frame):
         self._photo = None
         self.last_offsets: Tuple[float,float] = (0,0)
         self.last_zoom_used = self.zoom
+        self._tiled = None          # (índice, zoom, ancho, alto) en modo teselas
+        self._tiles = {}            # (tx, ty) -> (item, PhotoImage)
+        self._tiles_pending = None
+        self._shown = None          # (índice, zoom) del último render completo
+        self._base = None           # (índice, pixmap, zoom) último render mostrado
+        self._zoom_timer = None
+        self._placeholder_pending = None
+        # Modo continuo: todas las páginas apiladas, solo existen en el canvas
+        # las cercanas a la vista (ver _update_pages)
+        self.continuous = False
+        self.on_page_change: Optional[Callable] = None  # (índice) al cambiar la página actual
+        self._layout = None         # (zoom, ancho total, [top por página], [(w, h) en píxeles])
+        self._pages: Dict[int, list] = {}   # índice -> [rect, item imagen, PhotoImage, zoom mostrado]
+        self._pages_pending = None
 
         self.canvas.bind('<Button-1>', self._on_down)
         self.canvas.bind('<B1-Motion>', self._on_move)
@@ -45,6 +71,38 @@ class PageView(tk.Frame):
     # Public API
     def set_page(self, index: int):
         self.current_index = index
+        if self.continuous and self._layout:
+            self._scroll_to_page(index)
+            return
+        self.render()
+
+    def reload_pages(self, index: Optional[int]):
+        """
+        Tras cambiar el número o el orden de las páginas: la disposición
+        continua (posiciones e imágenes por índice) ya no vale y se rehace.
+        """
+        self._layout = None
+        self.current_index = index
+        if index is None:
+            self._clear()
+            return
+        self.render()
+
+    def show_document(self):
+        """Documento nuevo: descarta lo mostrado del anterior y va a la página 1."""
+        self._clear()
+        self.canvas.yview_moveto(0)
+        self.current_index = None
+        if self.get_page_count():
+            self.set_page(0)
+
+    def set_continuous(self, enabled: bool):
+        """Desplazamiento continuo (todas las páginas) o una página cada vez."""
+        if enabled == self.continuous:
+            return
+        self.continuous = enabled
+        self._clear()
+        self.canvas.yview_moveto(0)
         self.render()
 
     def set_tool(self, tool: Optional[Tool]):
@@ -77,32 +135,316 @@ class PageView(tk.Frame):
         self.canvas.yview_scroll(delta_units, 'units')
 
     def scroll_wheel_ctrl(self, zoom_in: bool):
-        self.change_zoom_factor(1.1 if zoom_in else 0.9)
+        self.zoom_to(self.zoom * (1.1 if zoom_in else 0.9))
+
+    def zoom_to(self, zoom: float):
+        """
+        Zoom para gestos continuos (slider, Ctrl+rueda): mientras llegan
+        valores se escala la imagen ya renderizada y solo se renderiza de
+        verdad el último, cuando el gesto se detiene ZOOM_SETTLE_MS.
+        """
+        if self.current_index is None: return
+        self.zoom_mode = 'custom'
+        self.zoom = max(0.1, min(zoom, 5.0))
+        if self._zoom_timer is not None:
+            self.after_cancel(self._zoom_timer)
+        self._zoom_timer = self.after(self.ZOOM_SETTLE_MS, self._settle_zoom)
+        if self._placeholder_pending is None:
+            self._placeholder_pending = self.after_idle(self._zoom_placeholder)
+
+    def _settle_zoom(self):
+        self._zoom_timer = None
+        self.render()
 
     # Rendering
     def render(self):
         if self.current_index is None:
             return
+        if self._zoom_timer is not None:
+            self.after_cancel(self._zoom_timer)
+            self._zoom_timer = None
         if self.zoom_mode == 'fit_width':
             probe = self.get_page_pixmap(self.current_index, 0.1)
             target_w = max(50, self.canvas.winfo_width())
             if probe.width > 0:
                 self.zoom = max(0.1, min(target_w / probe.width * 0.1, 5.0))
-        pix = self.get_page_pixmap(self.current_index, self.zoom)
-        img = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
-        self._photo = ImageTk.PhotoImage(img)
-        self.canvas.delete('all')
+        zoom = self.zoom
+        if self.continuous and self.scheduler and self.get_page_size:
+            self._render_continuous(zoom)
+            return
+        if self.scheduler and self.get_page_size:
+            w, h = self.get_page_size(self.current_index)
+            pw, ph = math.ceil(w * zoom - 1e-3), math.ceil(h * zoom - 1e-3)
+            if pw * ph > self.TILE_THRESHOLD:
+                self._render_tiled(zoom, pw, ph)
+                return
+        if self.scheduler:
+            # Misma página y zoom en pantalla (p.ej. tras editar): se deja la
+            # imagen actual hasta que llegue la nueva, sin vista previa.
+            preview = None
+            if self._shown != (self.current_index, zoom):
+                preview = lambda pix, z: self._show_preview(pix, z, zoom)
+            self.scheduler.request(self.current_index, zoom, lambda pix: self._show(pix, zoom),
+                                   preview=preview)
+        else:
+            self._show(self.get_page_pixmap(self.current_index, zoom), zoom)
+
+    def _show(self, pix, zoom: float):
+        self._place(pixmap_photo(pix, self), zoom)
+        self._shown = (self.current_index, zoom)
+        self._base = (self.current_index, pix, zoom)
+
+    def _show_preview(self, pix, pix_zoom: float, zoom: float):
+        """Render de otro zoom escalado al tamaño final, mientras llega el bueno."""
+        scale = zoom / pix_zoom
+        size = (max(1, round(pix.width * scale)), max(1, round(pix.height * scale)))
+        self._place(scaled_photo(pix, *size, master=self), zoom)
+        if not self._base or self._base[0] != self.current_index:
+            self._base = (self.current_index, pix, pix_zoom)
+
+    def _zoom_placeholder(self):
+        """Escala la última imagen al zoom pedido, recortada a la zona visible."""
+        self._placeholder_pending = None
+        if self.continuous or not self._base or self._base[0] != self.current_index \
+                or self._zoom_timer is None:
+            return
+        _, pix, base_zoom = self._base
+        scale = self.zoom / base_zoom
+        pw, ph = round(pix.width * scale), round(pix.height * scale)
         cw = self.canvas.winfo_width()
         ch = self.canvas.winfo_height()
-        x_off = (cw - pix.width)/2 if cw > pix.width else 0
-        y_off = (ch - pix.height)/2 if ch > pix.height else 0
-        self.canvas.create_image(x_off, y_off, image=self._photo, anchor='nw')
-        self.canvas.config(scrollregion=(0,0,max(cw,pix.width), max(ch,pix.height)))
+        x_off = (cw - pw)/2 if cw > pw else 0
+        y_off = (ch - ph)/2 if ch > ph else 0
+        self._clear()
+        self.canvas.config(scrollregion=(0,0,max(cw,pw), max(ch,ph)))
+        vx0, vy0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        x0, y0 = max(vx0, x_off), max(vy0, y_off)
+        x1, y1 = min(vx0 + cw, x_off + pw), min(vy0 + ch, y_off + ph)
+        if x1 - x0 >= 1 and y1 - y0 >= 1:
+            # Solo la parte visible del escalado
+            clip = (int(x0 - x_off), int(y0 - y_off), int(x1 - x_off), int(y1 - y_off))
+            self._photo = scaled_photo(pix, pw, ph, clip, self)
+            self.canvas.create_image(x0, y0, image=self._photo, anchor='nw')
         self.last_offsets = (x_off, y_off)
         self.last_zoom_used = self.zoom
         if self._tool:
             self._tool.on_page_rendered()
 
+    def _place(self, photo, zoom: float):
+        self._photo = photo
+        self._clear()
+        w, h = photo.width(), photo.height()
+        cw = self.canvas.winfo_width()
+        ch = self.canvas.winfo_height()
+        x_off = (cw - w)/2 if cw > w else 0
+        y_off = (ch - h)/2 if ch > h else 0
+        self.canvas.create_image(x_off, y_off, image=self._photo, anchor='nw')
+        self.canvas.config(scrollregion=(0,0,max(cw,w), max(ch,h)))
+        self.last_offsets = (x_off, y_off)
+        self.last_zoom_used = zoom
+        if self._tool:
+            self._tool.on_page_rendered()
+
+    def _clear(self):
+        self.canvas.delete('all')
+        self._shown = None
+        self._tiled = None
+        self._tiles.clear()
+        self._layout = None
+        self._pages.clear()
+
+    # Modo continuo: páginas apiladas; solo las cercanas a la vista existen
+    def _render_continuous(self, zoom: float):
+        count = self.get_page_count()
+        sizes = []
+        for i in range(count):
+            w, h = self.get_page_size(i)
+            sizes.append((math.ceil(w * zoom - 1e-3), math.ceil(h * zoom - 1e-3)))
+        if self._layout and self._layout[0] == zoom and self._layout[3] == sizes:
+            # Misma disposición (p.ej. tras editar): se vuelven a pedir las
+            # visibles; las imágenes actuales siguen hasta que llegue la nueva
+            for entry in self._pages.values():
+                entry[3] = None
+            self._update_pages()
+            return
+        # Conservar la posición relativa dentro de la página actual
+        frac = 0.0
+        if self._layout and self.current_index is not None and self.current_index < len(self._layout[2]):
+            old_top = self._layout[2][self.current_index]
+            old_h = self._layout[3][self.current_index][1]
+            frac = (self.canvas.canvasy(0) - old_top) / old_h if old_h else 0.0
+        self._clear()
+        width = max([w for w, _ in sizes] + [self.canvas.winfo_width()])
+        tops, y = [], self.PAGE_GAP
+        for _, h in sizes:
+            tops.append(y)
+            y += h + self.PAGE_GAP
+        self._layout = (zoom, width, tops, sizes)
+        self.canvas.config(scrollregion=(0, 0, width, max(y, self.canvas.winfo_height())))
+        self.last_zoom_used = zoom
+        index = min(self.current_index or 0, count - 1)
+        if count:
+            self.canvas.yview_moveto((tops[index] + frac * sizes[index][1]) / max(y, 1))
+            self._set_current(index)
+        self._update_pages()
+
+    def _scroll_to_page(self, index: int):
+        _, _, tops, _ = self._layout
+        total = float(self.canvas.cget('scrollregion').split()[3])
+        self.canvas.yview_moveto((tops[index] - self.PAGE_GAP) / total)
+        self._set_current(index)
+        self._update_pages()
+
+    def _page_x(self, index: int) -> float:
+        _, width, _, sizes = self._layout
+        return (width - sizes[index][0]) / 2
+
+    def _set_current(self, index: int):
+        """Página a la que se refieren las herramientas (last_offsets) y el resto de la app."""
+        changed = index != self.current_index
+        self.current_index = index
+        self.last_offsets = (self._page_x(index), self._layout[2][index])
+        if self._tool:
+            self._tool.on_page_rendered()
+        if changed and self.on_page_change:
+            self.on_page_change(index)
+
+    def _visible_pages(self, margin: float) -> range:
+        _, _, tops, sizes = self._layout
+        y0 = self.canvas.canvasy(0) - margin
+        y1 = self.canvas.canvasy(0) + self.canvas.winfo_height() + margin
+        first = max(0, bisect.bisect_right(tops, y0) - 1)
+        if first < len(tops) and tops[first] + sizes[first][1] < y0:
+            first += 1
+        return range(first, bisect.bisect_right(tops, y1))
+
+    def _update_pages(self):
+        self._pages_pending = None
+        if not self._layout:
+            return
+        zoom, _, tops, sizes = self._layout
+        ch = self.canvas.winfo_height()
+        # Página actual: la que ocupa el tercio superior de la vista
+        probe = self.canvas.canvasy(0) + ch / 3
+        index = max(0, min(bisect.bisect_right(tops, probe) - 1, len(tops) - 1))
+        if tops and index != self.current_index and not self._tool_busy():
+            self._set_current(index)
+        # Banda de precarga de una pantalla; se sueltan las que quedan a más de tres
+        wanted = self._visible_pages(ch)
+        keep = self._visible_pages(3 * ch)
+        for i in [i for i in self._pages if i not in keep]:
+            rect, item, _, _ = self._pages.pop(i)
+            self.canvas.delete(rect)
+            if item:
+                self.canvas.delete(item)
+        for i in wanted:
+            if i not in self._pages:
+                x, y = self._page_x(i), tops[i]
+                w, h = sizes[i]
+                rect = self.canvas.create_rectangle(x, y, x + w, y + h, fill='white', outline='#888')
+                self.canvas.tag_lower(rect)
+                self._pages[i] = [rect, None, None, None]
+        missing = [i for i in wanted if self._pages[i][3] != zoom]
+        if missing:
+            center = self.canvas.canvasy(0) + ch / 2
+            missing.sort(key=lambda i: abs(tops[i] + sizes[i][1] / 2 - center))
+            layout = self._layout
+            self.scheduler.request_pages([(i, zoom) for i in missing],
+                                         lambda i, pix: self._show_page(layout, i, pix))
+
+    def _tool_busy(self) -> bool:
+        # Con una edición a medias (cuadro de texto, imagen) la página actual no cambia
+        busy = getattr(self._tool, 'is_busy', None)
+        return bool(busy and busy())
+
+    def _show_page(self, layout, index: int, pix):
+        entry = self._pages.get(index)
+        if self._layout is not layout or entry is None:
+            return
+        rect, item, _, _ = entry
+        photo = pixmap_photo(pix, self)
+        new = self.canvas.create_image(self._page_x(index), layout[2][index], image=photo, anchor='nw')
+        self.canvas.tag_raise(new, rect)    # sobre su fondo, bajo los overlays de herramientas
+        if item:
+            self.canvas.delete(item)
+        self._pages[index] = [rect, new, photo, layout[0]]
+
+    def _schedule_pages(self):
+        if self._layout and self._pages_pending is None:
+            self._pages_pending = self.after_idle(self._update_pages)
+
+    # Teselas (zoom alto): solo se rasteriza lo que intersecta la vista
+    def _render_tiled(self, zoom: float, pw: int, ph: int):
+        self._clear()
+        self._photo = None
+        cw = self.canvas.winfo_width()
+        ch = self.canvas.winfo_height()
+        x_off = (cw - pw)/2 if cw > pw else 0
+        y_off = (ch - ph)/2 if ch > ph else 0
+        self.canvas.create_rectangle(x_off, y_off, x_off + pw, y_off + ph,
+                                     fill='white', outline='', tags='pagebg')
+        self.canvas.config(scrollregion=(0,0,max(cw,pw), max(ch,ph)))
+        self.last_offsets = (x_off, y_off)
+        self.last_zoom_used = zoom
+        self._tiled = (self.current_index, zoom, pw, ph)
+        if self._tool:
+            self._tool.on_page_rendered()
+        self._update_tiles()
+
+    def _visible_tiles(self, margin: int):
+        _, _, pw, ph = self._tiled
+        ox, oy = self.last_offsets
+        x0 = self.canvas.canvasx(0) - ox - margin
+        y0 = self.canvas.canvasy(0) - oy - margin
+        x1 = x0 + self.canvas.winfo_width() + 2 * margin
+        y1 = y0 + self.canvas.winfo_height() + 2 * margin
+        cols = range(max(0, int(x0 // TILE_SIZE)), min(math.ceil(pw / TILE_SIZE), int(x1 // TILE_SIZE) + 1))
+        rows = range(max(0, int(y0 // TILE_SIZE)), min(math.ceil(ph / TILE_SIZE), int(y1 // TILE_SIZE) + 1))
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        tiles = [(tx, ty) for ty in rows for tx in cols]
+        # Primero las del centro de la vista
+        tiles.sort(key=lambda t: ((t[0] + .5) * TILE_SIZE - cx) ** 2 + ((t[1] + .5) * TILE_SIZE - cy) ** 2)
+        return tiles
+
+    def _update_tiles(self):
+        self._tiles_pending = None
+        if not self._tiled:
+            return
+        wanted = self._visible_tiles(self.TILE_MARGIN)
+        # Soltar las teselas que quedaron lejos (siguen en la caché de render)
+        keep = set(self._visible_tiles(self.TILE_MARGIN * 4))
+        for tile in [t for t in self._tiles if t not in keep]:
+            self.canvas.delete(self._tiles.pop(tile)[0])
+        missing = [t for t in wanted if t not in self._tiles]
+        if missing:
+            index, zoom, _, _ = self._tiled
+            key = self._tiled
+            self.scheduler.request_tiles(index, zoom, missing,
+                                         lambda tile, pix: self._show_tile(key, tile, pix))
+
+    def _show_tile(self, key, tile, pix):
+        if self._tiled != key or tile in self._tiles:
+            return
+        photo = pixmap_photo(pix, self)
+        ox, oy = self.last_offsets
+        item = self.canvas.create_image(ox + pix.x, oy + pix.y, image=photo, anchor='nw')
+        # Justo sobre el fondo: debajo de los overlays de las herramientas
+        self.canvas.tag_raise(item, 'pagebg')
+        self._tiles[tile] = (item, photo)
+
+    def _schedule_tiles(self):
+        if self._tiled and self._tiles_pending is None:
+            self._tiles_pending = self.after_idle(self._update_tiles)
+
+    def _on_yscroll(self, *args):
+        self.v_scroll.set(*args)
+        self._schedule_tiles()
+        self._schedule_pages()
+
+    def _on_xscroll(self, *args):
+        self.h_scroll.set(*args)
+        self._schedule_tiles()
+
     # Helpers
     def canvas_to_page(self, cx, cy):
         ox, oy = self.last_offsets
@@ -121,6 +463,14 @@ class PageView(tk.Frame):
 
     # Event delegation
     def _on_down(self, e):
+        if self._layout:
+            # Modo continuo: la herramienta actúa sobre la página pulsada
+            _, _, tops, sizes = self._layout
+            y = self.canvas.canvasy(e.y)
+            index = bisect.bisect_right(tops, y) - 1
+            if 0 <= index < len(tops) and y <= tops[index] + sizes[index][1] \
+                    and index != self.current_index and not self._tool_busy():
+                self._set_current(index)
         if self._tool: self._tool.on_mouse_down(e)
     def _on_move(self, e):
         if self._tool: self._tool.on_mouse_move(e)
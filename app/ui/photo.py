@@ -0,0 +1,140 @@
+import tkinter as tk
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+def pixmap_photo(pix, master=None) -> tk.PhotoImage:
+    """
+    PhotoImage de Tk directamente desde un pixmap RGB de fitz, sin pasar por
+    PIL: cabecera PPM + muestras en un solo bytes (única copia en Python);
+    Tk lo decodifica a su bloque de imagen.
+    """
+    if pix.alpha or pix.n != 3 or pix.stride != pix.width * 3:
+        data = pix.tobytes('ppm')
+    else:
+        data = b'P6\n%d %d\n255\n' % (pix.width, pix.height) + pix.samples_mv
+    return tk.PhotoImage(master=master, data=data, format='PPM')
+
+
+def pixmap_image(pix) -> Image.Image:
+    """Imagen PIL del pixmap leyendo sus muestras en sitio (sin la copia de pix.samples)."""
+    return Image.frombuffer('RGB', (pix.width, pix.height), pix.samples_mv, 'raw', 'RGB', pix.stride, 1)
+
+
+def scaled_photo(pix, width: int, height: int, clip=None, master=None) -> tk.PhotoImage:
+    """
+    pixmap_photo de `pix` escalado a width x height por MuPDF (sin pasar
+    por PIL); con `clip` (x0, y0, x1, y1 en píxeles del escalado) solo se
+    calcula esa parte.
+    """
+    return pixmap_photo(fitz.Pixmap(pix, width, height, clip), master)
+
+
+_TK_PIXEL = 4    # Tk guarda las fotos a 32 bits por píxel; Pillow también el modo RGB
+_BENCH_CASES = ('PIL/ImageTk', 'PPM directo', 'previa PIL', 'previa MuPDF')
+
+
+def _bench_case(name: str, pix, root):
+    """
+    Muestra `pix` por el camino `name` y devuelve las copias hechas:
+    [(etapa, bytes)]. Las etapas de Tk solo corren con `root`.
+    """
+    copies = []
+    half = (pix.width // 2, pix.height // 2)
+    if name in ('PIL/ImageTk', 'previa PIL'):
+        if name == 'PIL/ImageTk':
+            samples = pix.samples
+            copies.append(('pix.samples', len(samples)))
+            img = Image.frombytes('RGB', (pix.width, pix.height), samples)
+            copies.append(('Image.frombytes', img.width * img.height * _TK_PIXEL))
+        else:
+            img = pixmap_image(pix)     # frombuffer no mapea RGB: copia
+            copies.append(('Image.frombuffer', img.width * img.height * _TK_PIXEL))
+            img = img.resize(half, Image.BILINEAR)
+            copies.append(('Image.resize', img.width * img.height * _TK_PIXEL))
+        if not img.im.isblock():
+            copies.append(('bloque ImageTk', img.width * img.height * _TK_PIXEL))
+        if root:
+            from PIL import ImageTk
+            ImageTk.PhotoImage(img, master=root)
+        copies.append(('foto Tk', img.width * img.height * _TK_PIXEL))
+    else:
+        if name == 'previa MuPDF':
+            pix = fitz.Pixmap(pix, *half)
+            copies.append(('fitz.Pixmap escalado', len(pix.samples_mv)))
+        data = b'P6\n%d %d\n255\n' % (pix.width, pix.height) + pix.samples_mv
+        copies.append(('PPM', len(data)))
+        if root:
+            tk.PhotoImage(master=root, data=data, format='PPM')
+        copies.append(('Tcl ByteArray', len(data)))
+        copies.append(('foto Tk', pix.width * pix.height * _TK_PIXEL))
+    return copies
+
+
+def _bench_setup(path: str, zoom: float):
+    pix = fitz.open(path).load_page(0).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+    return pix, root
+
+
+def _proc_kb(field: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _bench_peak(path: str, zoom: float, name: str) -> int:
+    """
+    Proceso aparte: pico de memoria residente (incluye Pillow, Tcl y Tk)
+    que añade mostrar una imagen por `name`. Solo Linux (/proc).
+    """
+    import gc
+    pix, root = _bench_setup(path, zoom)
+    gc.collect()
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')    # reinicia VmHWM
+    base = _proc_kb('VmRSS')
+    _bench_case(name, pix, root)
+    return (_proc_kb('VmHWM') - base) * 1024
+
+
+def _benchmark(path: str, zoom: float = 1.5, rounds: int = 20):
+    """
+    Bytes copiados por imagen mostrada, etapa a etapa, en el camino
+    anterior (samples -> Image.frombytes -> ImageTk, Image.resize para la
+    vista previa) frente a pixmap_photo/scaled_photo; además el tiempo y,
+    en Linux, el pico de memoria residente medido en un proceso aparte
+    por caso. Sin $DISPLAY no se crean las fotos de Tk (sus copias se
+    cuentan igual).
+        python -m app.ui.photo fichero.pdf
+    """
+    import multiprocessing as mp
+    import os
+    import time
+    pix, root = _bench_setup(path, zoom)
+    print(f'{pix.width}x{pix.height} px' + ('' if root else ' (sin $DISPLAY: sin crear las fotos de Tk)'))
+    ctx = mp.get_context('spawn')
+    for name in _BENCH_CASES:
+        t = time.perf_counter()
+        for _ in range(rounds):
+            copies = _bench_case(name, pix, root)
+        ms = (time.perf_counter() - t) / rounds * 1000
+        peak = ''
+        if os.path.exists('/proc/self/clear_refs'):
+            with ctx.Pool(1) as pool:
+                peak = f'  pico RSS {pool.apply(_bench_peak, (path, zoom, name)) / 1e6:5.1f} MB'
+        total = sum(n for _, n in copies)
+        print(f'  {name:12} {total / 1e6:5.1f} MB copiados  {ms:6.2f} ms{peak}')
+        for stage, n in copies:
+            print(f'      {stage:22} {n / 1e6:5.1f} MB')
+
+
+if __name__ == '__main__':
+    import sys
+    _benchmark(sys.argv[1])
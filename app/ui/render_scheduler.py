@@ -0,0 +1,184 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class RenderScheduler:
+    """
+    Sirve renders de página (o teselas) sin bloquear la UI:
+    - caché de DocumentManager si ya existe;
+    - proceso RasterWorker, resultado recogido con after(): las páginas
+      sin editar las tiene ya; las editadas se le pasan sueltas
+      (DocumentManager.share_edited_page);
+    - sin proceso (aún arrancando, caído o un render que falló): hilo
+      principal, un render por after_idle para que la UI pinte entre medias.
+    Cada petición nueva cancela las anteriores que no hayan empezado y
+    precarga las páginas vecinas al mismo zoom. Con `preview`, antes del
+    render final se entrega uno barato (caché a otro zoom o PREVIEW_ZOOM).
+    Con cache=False lo que llega del proceso no entra en la caché de render
+    (exportaciones masivas que la vaciarían).
+    """
+    PREVIEW_ZOOM = 0.25
+
+    def __init__(self, widget, doc, poll_ms: int = 15, prefetch: int = 1, channel: int = 0,
+                 cache: bool = True):
+        self.widget = widget
+        self.doc = doc
+        self.cache = cache
+        self.channel = channel  # canal de cancelación en el RasterWorker compartido
+        self.poll_ms = poll_ms
+        self.prefetch = prefetch
+        self.gen = 0
+        self._worker = None
+        self._jobs: Dict[int, Tuple[int, int, int, int, float, object, Optional[Callable]]] = {}
+        self._main: List[Tuple[int, float, object, Callable]] = []   # cola del hilo principal
+        self._idle = None
+        self._polling = False
+
+    def request(self, index: int, zoom: float, callback: Callable,
+                preview: Optional[Callable] = None):
+        """
+        callback(pix) recibirá el render de (index, zoom) salvo que se cancele.
+        preview(pix, zoom), si se da, recibe antes una versión de menor
+        resolución; nunca llega después del render final.
+        """
+        self.cancel()
+        done = []
+
+        def final(pix):
+            done.append(True)
+            callback(pix)
+
+        def early(pix, z):
+            if not done:
+                preview(pix, z)
+        if preview and self.doc.cached_pixmap(index, zoom) is None:
+            cached = self.doc.preview_pixmap(index, zoom)
+            if cached is not None:
+                early(*cached)
+            elif zoom > self.PREVIEW_ZOOM * 1.5:
+                self._want(index, self.PREVIEW_ZOOM, None, lambda pix: early(pix, self.PREVIEW_ZOOM))
+        self._want(index, zoom, None, final)
+        for i in range(index - self.prefetch, index + self.prefetch + 1):
+            if i != index and 0 <= i < self.doc.page_count():
+                self._prefetch(i, zoom)
+
+    def request_tiles(self, index: int, zoom: float, tiles: Iterable, callback: Callable):
+        """callback(tile, pix) por cada tesela; cancela lo pedido antes."""
+        self.cancel()
+        for tile in tiles:
+            self._want(index, zoom, tile, lambda pix, t=tile: callback(t, pix))
+
+    def request_pages(self, pages: Iterable[Tuple[int, float]], callback: Callable):
+        """callback(index, pix) por cada (index, zoom); cancela lo pedido antes."""
+        self.cancel()
+        for index, zoom in pages:
+            self._want(index, zoom, None, lambda pix, i=index: callback(i, pix))
+
+    def cancel(self):
+        """Descarta lo pendiente: ya no se llamará a ningún callback anterior."""
+        self.gen += 1
+        self._main.clear()
+        if self._idle is not None:
+            self.widget.after_cancel(self._idle)
+            self._idle = None
+        worker = self._current_worker()
+        if worker:
+            worker.cancel_before(self.gen, self.channel)
+
+    # ---------- Internos ----------
+    def _current_worker(self):
+        worker = self.doc.raster_worker()
+        if worker is not self._worker:
+            # Documento nuevo (o cerrado): lo pendiente era del anterior
+            self._worker = worker
+            self._jobs.clear()
+        if worker is not None and not worker.alive():
+            return None
+        return worker
+
+    def _want(self, index: int, zoom: float, tile, callback: Callable):
+        pix = self.doc.cached_pixmap(index, zoom, tile)
+        if pix is not None:
+            callback(pix)
+            return
+        worker = self._current_worker()
+        if worker is not None and worker.ready and self._submit(worker, index, zoom, tile, callback):
+            return
+        if worker is not None:
+            self._start_polling()   # hasta que el proceso esté listo
+        self._main.append((index, zoom, tile, callback))
+        if self._idle is None:
+            self._idle = self.widget.after_idle(self._run_main)
+
+    def _run_main(self):
+        self._idle = None
+        if not self._main:
+            return
+        index, zoom, tile, callback = self._main.pop(0)
+        if index < self.doc.page_count():
+            if tile is None:
+                callback(self.doc.get_page_pixmap(index, zoom))
+            else:
+                callback(self.doc.get_tile_pixmap(index, zoom, tile))
+        if self._main and self._idle is None:
+            self._idle = self.widget.after_idle(self._run_main)
+
+    def _prefetch(self, index: int, zoom: float):
+        worker = self._current_worker()
+        if worker is None or self.doc.cached_pixmap(index, zoom) is not None:
+            return
+        self._submit(worker, index, zoom, None, None)
+
+    def _submit(self, worker, index: int, zoom: float, tile, callback: Optional[Callable]) -> bool:
+        xref, rev = self.doc.page_revision(index)
+        page = None
+        if self.doc.pristine_xref(index) is None:
+            page = self.doc.share_edited_page(index)
+            if page is None:
+                return False    # el proceso tiene otra versión de la página
+        job_id = worker.submit(xref, zoom, self.gen, tile, self.channel, page)
+        self._jobs[job_id] = (self.gen, index, xref, rev, zoom, tile, callback)
+        self._start_polling()
+        return True
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        worker = self._worker
+        if worker is None or worker is not self.doc.raster_worker():
+            self._polling = False
+            return
+        for job_id, pix in worker.poll(self.channel):
+            info = self._jobs.pop(job_id, None)
+            if info is None:
+                continue
+            gen, index, xref, rev, zoom, tile, callback = info
+            if pix is None:
+                self._fallback(gen, index, zoom, tile, callback)
+                continue
+            if self.cache:
+                self.doc.store_pixmap(xref, zoom, pix, tile, rev)
+            if callback and gen == self.gen:
+                callback(pix)
+        if (worker.busy(self.channel) or not worker.ready) and worker.alive():
+            self.widget.after(self.poll_ms, self._poll)
+            return
+        self._polling = False
+        if not worker.alive():
+            self._recover()
+
+    def _recover(self):
+        """El proceso murió: lo pendiente vigente pasa al hilo principal."""
+        jobs, self._jobs = self._jobs, {}
+        for gen, index, _, _, zoom, tile, callback in jobs.values():
+            self._fallback(gen, index, zoom, tile, callback)
+
+    def _fallback(self, gen: int, index: int, zoom: float, tile, callback: Optional[Callable]):
+        """Un trabajo vigente que el proceso no sirvió se hace en el hilo principal."""
+        if not (callback and gen == self.gen):
+            return
+        self._main.append((index, zoom, tile, callback))
+        if self._idle is None:
+            self._idle = self.widget.after_idle(self._run_main)
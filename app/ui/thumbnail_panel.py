@@ -1,39 +1,156 @@
 import tkinter as tk
+from typing import Callable, Dict, Optional
+from .photo import pixmap_photo
 
 class ThumbnailPanel(tk.Frame):
-    def __init__(self, master, on_select):
+    """
+    Lista virtualizada de miniaturas: filas de alto fijo dibujadas en un
+    Canvas; solo existen items e imágenes para las filas visibles y las
+    miniaturas se piden (request_thumbs) al desplazarse.
+    """
+    ROW_H = 150
+    THUMB_W = 120
+    THUMB_H = 130
+    WIDTH = 150
+
+    def __init__(self, master, on_select, request_thumbs: Optional[Callable] = None):
         super().__init__(master, width=160)
         self.on_select = on_select
-        self.canvas = tk.Canvas(self, width=150)
+        # request_thumbs(indices, callback(index, pix)): pide los renders que falten
+        self.request_thumbs = request_thumbs
+        self.canvas = tk.Canvas(self, width=self.WIDTH, highlightthickness=0)
         self.scrollbar = tk.Scrollbar(self, orient='vertical', command=self.canvas.yview)
-        self.inner = tk.Frame(self.canvas)
-        self.inner.bind('<Configure>', lambda e: self.canvas.configure(scrollregion=self.canvas.bbox('all')))
-        self.canvas.create_window((0,0), window=self.inner, anchor='nw')
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
         self.canvas.pack(side='left', fill='y')
         self.scrollbar.pack(side='right', fill='y')
-        self.thumbs = []
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Configure>', lambda e: self._schedule_update())
+        self.canvas.bind('<MouseWheel>', lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, 'units'))
+        self.count = 0
         self.selected_index = None
+        self._rows: Dict[int, list] = {}        # índice -> ids de items de la fila
+        self._photos: Dict[int, tk.PhotoImage] = {}
+        self._pending = None
 
     def clear(self):
-        for child in self.inner.winfo_children():
-            child.destroy()
-        self.thumbs.clear()
+        self.set_count(0)
 
-    def add_thumbnail(self, index, photo):
-        btn = tk.Button(self.inner, image=photo, command=lambda i=index: self._select_and_call(i))
-        btn.image = photo  # keep ref
-        btn.pack(pady=4)
-        self.thumbs.append(btn)
+    def set_count(self, count: int):
+        """Número de páginas; descarta todas las filas dibujadas."""
+        self.count = count
+        self.canvas.delete('all')
+        self._rows.clear()
+        self._photos.clear()
+        self.canvas.configure(scrollregion=(0, 0, self.WIDTH, count * self.ROW_H))
+        self._schedule_update()
 
-    def _select_and_call(self, index):
-        self.select(index)
-        self.on_select(index)
+    def apply_changes(self, changes):
+        """
+        Refresco incremental (core.doc_manager.PageChanges): conserva las
+        miniaturas de páginas que solo se movieron y vuelve a pedir las
+        cambiadas o insertadas.
+        """
+        if changes.reset:
+            self.set_count(len(changes.old_index))
+            return
+        if changes.is_empty():
+            return
+        photos = {}
+        for new, old in enumerate(changes.old_index):
+            if old is not None and new not in changes.changed and old in self._photos:
+                photos[new] = self._photos[old]
+        self.count = len(changes.old_index)
+        self.canvas.delete('all')
+        self._rows.clear()
+        self._photos.clear()
+        self.canvas.configure(scrollregion=(0, 0, self.WIDTH, self.count * self.ROW_H))
+        visible = self._visible()
+        for index, photo in photos.items():
+            if index in visible:
+                self._draw_row(index)
+                self._place_photo(index, photo)
+        self._schedule_update()
 
     def select(self, index):
         self.selected_index = index
-        for i, btn in enumerate(self.thumbs):
-            if i == index:
-                btn.config(relief='sunken', borderwidth=3)
-            else:
-                btn.config(relief='raised', borderwidth=1)
+        self._draw_selection()
+        if index is None:
+            return
+        # Asegurar que la seleccionada queda a la vista
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        y0, y1 = index * self.ROW_H, (index + 1) * self.ROW_H
+        if self.count and (y0 < top or y1 > top + height):
+            self.canvas.yview_moveto(max(0, y0 - (height - self.ROW_H) / 2) / (self.count * self.ROW_H))
+
+    # ---------- Internos ----------
+    def _on_click(self, e):
+        index = int(self.canvas.canvasy(e.y) // self.ROW_H)
+        if 0 <= index < self.count:
+            self.select(index)
+            self.on_select(index)
+
+    def _on_scroll(self, *args):
+        self.scrollbar.set(*args)
+        self._schedule_update()
+
+    def _schedule_update(self):
+        if self._pending is None:
+            self._pending = self.after_idle(self._update)
+
+    def _visible(self):
+        top = self.canvas.canvasy(0)
+        first = max(0, int(top // self.ROW_H) - 1)
+        last = min(self.count, int((top + self.canvas.winfo_height()) // self.ROW_H) + 2)
+        return range(first, last)
+
+    def _update(self):
+        self._pending = None
+        visible = self._visible()
+        for index in [i for i in self._rows if i not in visible]:
+            self._drop_row(index)
+        missing = []
+        for index in visible:
+            if index not in self._rows:
+                self._draw_row(index)
+            if index not in self._photos:
+                missing.append(index)
+        self._draw_selection()
+        if missing and self.request_thumbs:
+            self.request_thumbs(missing, self._set_thumb)
+
+    def _draw_row(self, index: int):
+        y = index * self.ROW_H
+        x0 = (self.WIDTH - self.THUMB_W) / 2
+        frame = self.canvas.create_rectangle(x0, y + 4, x0 + self.THUMB_W, y + 4 + self.THUMB_H,
+                                             outline='#999', fill='#eee')
+        label = self.canvas.create_text(self.WIDTH / 2, y + self.ROW_H - 8, text=str(index + 1),
+                                        fill='#333', font=('TkDefaultFont', 8))
+        self._rows[index] = [frame, label]
+
+    def _drop_row(self, index: int):
+        for item in self._rows.pop(index):
+            self.canvas.delete(item)
+        self._photos.pop(index, None)
+
+    def _set_thumb(self, index: int, pix):
+        if index not in self._rows or index in self._photos:
+            return  # ya no visible
+        # Ya viene renderizada al tamaño de la fila (zoom de ajuste)
+        self._place_photo(index, pixmap_photo(pix, self))
+
+    def _place_photo(self, index: int, photo):
+        y = index * self.ROW_H + 4 + (self.THUMB_H - photo.height()) / 2
+        item = self.canvas.create_image(self.WIDTH / 2, y, image=photo, anchor='n')
+        self._rows[index].append(item)
+        self._photos[index] = photo
+
+    def _draw_selection(self):
+        self.canvas.delete('sel')
+        index = self.selected_index
+        if index is None or index not in self._rows:
+            return
+        y = index * self.ROW_H
+        x0 = (self.WIDTH - self.THUMB_W) / 2 - 3
+        self.canvas.create_rectangle(x0, y + 1, self.WIDTH - x0, y + 7 + self.THUMB_H,
+                                     outline='#0077ff', width=3, tags='sel')
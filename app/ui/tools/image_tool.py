@@ -128,6 +128,10 @@ class ImageTool:
         if self._page_rect and self._rect_id:
             self._reposition_overlay()
 
+    def is_busy(self) -> bool:
+        """Hay una imagen colocada pendiente de confirmar en la página actual."""
+        return self._rect_id is not None
+
     def deactivate(self):
         self._destroy_overlay()
         self._drag_start_canvas = None
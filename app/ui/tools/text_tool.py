@@ -155,6 +155,10 @@ class TextTool:
         if self._editing and self._page_rect:
             self._reposition_overlay()
 
+    def is_busy(self) -> bool:
+        """Hay un cuadro abierto ligado a la página actual."""
+        return self._editing or self._rect_id is not None
+
     def deactivate(self):
         # Commit implícito? Mejor no. Solo limpiar.
         self._destroy_overlay()
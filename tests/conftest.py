@@ -0,0 +1,36 @@
+import fitz  # PyMuPDF
+import pytest
+
+from app.core.doc_manager import DocumentManager
+from app.core.history import HistoryManager
+
+
+def make_pdf(path, pages: int = 4, prefix: str = 'page'):
+    """PDF de prueba: una línea de texto por página."""
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f'{prefix} {i}')
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def page_state(doc: fitz.Document) -> list:
+    """Texto, rotación y anotaciones de cada página (para comparar estados)."""
+    return [(page.get_text(), page.rotation,
+             sorted((a.type[0], tuple(round(v) for v in a.rect)) for a in page.annots()))
+            for page in doc]
+
+
+@pytest.fixture
+def sample_pdf(tmp_path):
+    return make_pdf(tmp_path / 'sample.pdf')
+
+
+@pytest.fixture
+def manager(sample_pdf):
+    doc = DocumentManager()
+    doc.set_history(HistoryManager())
+    doc.open(sample_pdf)
+    yield doc
+    doc.close()
@@ -0,0 +1,106 @@
+import fitz  # PyMuPDF
+
+from app.core.dedupe import dedupe_resources
+from app.core.doc_manager import DocumentManager
+from app.core.history import HistoryManager
+from tests.conftest import make_pdf, page_state
+
+_LOGO = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+_LOGO.set_rect(_LOGO.irect, (200, 30, 30))
+_LOGO_PNG = _LOGO.tobytes('png')
+
+
+def make_invoice(path, n: int):
+    """Factura de prueba: mismo logo y misma fuente, texto distinto."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(20, 20, 84, 84), stream=_LOGO_PNG)
+    page.insert_text((72, 150), f'factura {n}', fontname='Courier')
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _objects(doc, start=1):
+    """Texto de los objetos vivos desde `start` (los borrados se saltan)."""
+    out = {}
+    for x in range(start, doc.xref_length()):
+        try:
+            out[x] = doc.xref_object(x, compressed=True)
+        except RuntimeError:
+            pass
+    return out
+
+
+def _count(doc, pattern):
+    return sum(1 for text in _objects(doc).values() if pattern in text)
+
+
+def _merged(tmp_path, count=3):
+    doc = fitz.open()
+    for i in range(count):
+        with fitz.open(make_invoice(tmp_path / f'f{i}.pdf', i)) as src:
+            doc.insert_pdf(src)
+    return doc
+
+
+def test_merges_identical_images_and_fonts(tmp_path):
+    doc = _merged(tmp_path)
+    before = page_state(doc)
+    pixels = [doc[i].get_pixmap().samples for i in range(doc.page_count)]
+    assert _count(doc, '/Subtype/Image') == 3
+    assert dedupe_resources(doc, 1) >= 2 * 2
+    assert _count(doc, '/Subtype/Image') == 1
+    assert _count(doc, '/BaseFont/Courier') == 1
+    assert page_state(doc) == before
+    assert [doc[i].get_pixmap().samples for i in range(doc.page_count)] == pixels
+    with fitz.open(stream=doc.tobytes(), filetype='pdf') as saved:
+        assert not saved.is_repaired and page_state(saved) == before
+
+
+def test_content_streams_stay_separate(tmp_path):
+    doc = fitz.open()
+    for i in range(2):
+        with fitz.open(make_pdf(tmp_path / f'same{i}.pdf', pages=1, prefix='igual')) as src:
+            doc.insert_pdf(src)
+    dedupe_resources(doc, 1)
+    assert doc[0].get_contents() != doc[1].get_contents()
+
+
+def test_reuse_from_keeps_existing_objects(tmp_path):
+    doc = _merged(tmp_path, 1)
+    first = doc.xref_length()
+    with fitz.open(make_invoice(tmp_path / 'new.pdf', 9)) as src:
+        doc.insert_pdf(src)
+    original = {x: t for x, t in _objects(doc).items() if x < first}
+    assert dedupe_resources(doc, first) == 0    # sin reuse_from no mira lo anterior
+    assert dedupe_resources(doc, first, reuse_from=1) >= 2
+    assert {x: t for x, t in _objects(doc).items() if x < first} == original
+    assert _count(doc, '/Subtype/Image') == 1
+    assert 'factura 9' in doc[1].get_text()
+
+
+def test_merge_without_document_is_untitled(tmp_path):
+    paths = [make_pdf(tmp_path / f'in{i}.pdf', pages=5, prefix=f'doc{i}') for i in range(4)]
+    doc = DocumentManager()
+    doc.set_history(HistoryManager())
+    result = doc.insert_pdfs(paths)
+    assert result['pages'] == 20
+    assert doc.page_count() == 20
+    assert doc.path is None and doc.dirty
+    assert 'doc0 0' in doc._fitz_doc[0].get_text()
+    assert 'doc3 4' in doc._fitz_doc[19].get_text()
+    doc.close()
+
+
+def test_insert_pdfs_merges_and_undoes(manager, tmp_path):
+    paths = [make_invoice(tmp_path / f'f{i}.pdf', i) for i in range(3)]
+    original = page_state(manager._fitz_doc)
+    result = manager.insert_pdfs(paths)
+    assert result['pages'] == 3 and result['merged'] > 0
+    merged = page_state(manager._fitz_doc)
+    assert _count(manager._fitz_doc, '/Subtype/Image') == 1
+    manager.undo()
+    assert page_state(manager._fitz_doc) == original
+    manager.redo()
+    assert page_state(manager._fitz_doc) == merged
@@ -0,0 +1,81 @@
+import fitz  # PyMuPDF
+
+from app.core.delta import DeltaRecorder, apply_delta, page_closure
+from app.core.history import BlobStore
+from tests.conftest import make_pdf, page_state
+
+
+def _open(tmp_path):
+    return fitz.open(make_pdf(tmp_path / 'delta.pdf'))
+
+
+def _roundtrip(doc, store, edit, structure=False):
+    """Aplica `edit` grabando un delta; comprueba deshacer y rehacer."""
+    before = page_state(doc)
+    rec = DeltaRecorder(doc, store)
+    if structure:
+        rec.track_structure()
+    else:
+        rec.track_page(0)
+    edit(doc)
+    delta = rec.finish()
+    after = page_state(doc)
+    assert after != before
+    apply_delta(doc, delta, undo=True, fetch=store.get)
+    assert page_state(doc) == before
+    apply_delta(doc, delta, undo=False, fetch=store.get)
+    assert page_state(doc) == after
+    return delta
+
+
+def test_page_closure_stays_on_page(tmp_path):
+    doc = _open(tmp_path)
+    closure = page_closure(doc, doc.page_xref(0))
+    assert doc.page_xref(0) in closure
+    assert not closure & {doc.page_xref(i) for i in range(1, doc.page_count)}
+    assert doc[0].get_contents()[0] in closure
+
+
+def test_delta_annotation_undo_redo(tmp_path):
+    doc = _open(tmp_path)
+    store = BlobStore()
+    delta = _roundtrip(doc, store, lambda d: d[0].add_highlight_annot(fitz.Rect(10, 10, 100, 100)))
+    assert delta.pages == (doc.page_xref(0),) and not delta.structure
+    assert any(src == 'null' for src in delta.objs_before.values())   # anotación creada
+
+
+def test_delta_content_stream_undo_redo(tmp_path):
+    doc = _open(tmp_path)
+    store = BlobStore()
+    delta = _roundtrip(doc, store, lambda d: d[0].insert_text((72, 200), 'extra'))
+    assert delta.streams_after
+    assert set(delta.blob_keys()) <= set(store._blobs)
+
+
+def test_delta_structure_undo_redo(tmp_path):
+    doc = _open(tmp_path)
+    store = BlobStore()
+    delta = _roundtrip(doc, store, lambda d: d.delete_page(1), structure=True)
+    assert delta.structure
+    assert doc.page_count == 3
+    apply_delta(doc, delta, undo=True, fetch=store.get)
+    assert doc.page_count == 4
+
+
+def test_unchanged_streams_are_released(tmp_path):
+    doc = _open(tmp_path)
+    store = BlobStore()
+    rec = DeltaRecorder(doc, store)
+    rec.track_page(0)
+    assert len(store)
+    delta = rec.finish()
+    assert delta.is_empty() and len(store) == 0
+
+
+def test_discard_releases_references(tmp_path):
+    doc = _open(tmp_path)
+    store = BlobStore()
+    rec = DeltaRecorder(doc, store)
+    rec.track_page(0)
+    rec.discard()
+    assert len(store) == 0
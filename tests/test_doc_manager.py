@@ -0,0 +1,80 @@
+import os
+import fitz  # PyMuPDF
+
+from app.core import doc_manager
+from app.core.doc_manager import DocumentManager
+
+
+def test_backing_is_a_private_copy(sample_pdf, tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_manager, 'default_cache_dir', lambda name: str(tmp_path / name))
+    doc = DocumentManager()
+    doc.open(sample_pdf, low_memory=True)
+    backing = doc._backing
+    assert os.path.dirname(backing) == str(tmp_path / 'open')
+    assert os.stat(backing).st_ino != os.stat(sample_pdf).st_ino
+    with open(sample_pdf, 'r+b') as f:    # escrito por otro programa
+        f.write(b'garbage')
+    assert doc._fitz_doc[0].get_text().startswith('page 0')
+    doc.close()
+    assert not os.path.exists(backing)
+
+
+def test_remove_stale_backings(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_manager, 'default_cache_dir', lambda name: str(tmp_path))
+    monkeypatch.setattr(doc_manager, '_process_alive', lambda pid: pid == 1234)
+    for name in ('1234-live.pdf', '999999-dead.pdf', 'old.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF')
+    DocumentManager.remove_stale_backings()
+    assert os.listdir(tmp_path) == ['1234-live.pdf']
+
+
+def _linked_pdf(path):
+    doc = fitz.open()
+    for i in range(5):
+        doc.new_page().insert_text((72, 72), f'page {i}')
+    doc[0].insert_link({'kind': fitz.LINK_GOTO, 'from': fitz.Rect(10, 10, 50, 50), 'page': 3})
+    doc.set_toc([[1, 'uno', 1], [1, 'cuatro', 4]])
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_remove_page_touches_only_relinked_pages(manager, tmp_path):
+    manager.close()
+    manager.open(_linked_pdf(tmp_path / 'links.pdf'))
+    revs = [manager.page_revision(i) for i in range(5)]
+    manager.remove_page(3)      # page 0 linked to it
+    assert manager.page_revision(0) != revs[0]
+    assert [manager.page_revision(i) for i in (1, 2, 3)] == [revs[1], revs[2], revs[4]]
+    assert [manager.pristine_xref(i) for i in (1, 2, 3)] == [revs[1][0], revs[2][0], revs[4][0]]
+    assert not manager._fitz_doc[0].get_links()
+    manager.undo()
+    assert manager._fitz_doc[0].get_links()[0]['page'] == 3
+
+
+def test_save_reseeds_raster_worker(manager):
+    manager.add_highlight_rect(1, (10, 10, 100, 100))
+    xref = manager._fitz_doc.page_xref(1)
+    assert manager.pristine_xref(1) is None
+    manager.save()
+    assert manager.pristine_xref(1) == xref
+    manager.undo()
+    assert manager.pristine_xref(1) is None
+
+
+def test_failed_edit_in_transaction_keeps_earlier_edits(manager, tmp_path):
+    manager.add_text(0, 72, 200, 'A')
+    with manager.transaction():
+        manager.add_text(0, 72, 300, 'B')
+        assert not manager.add_text_box(0, (72, 400, 300, 500), '')
+        assert not manager.add_image(0, (72, 400, 300, 500), str(tmp_path / 'missing.png'))
+    assert manager._history.stats()['entries'] == 2
+    manager.undo()
+    text = manager._fitz_doc[0].get_text()
+    assert 'A' in text and 'B' not in text
+    manager.undo()
+    assert 'A' not in manager._fitz_doc[0].get_text()
+    manager.redo()
+    manager.redo()
+    text = manager._fitz_doc[0].get_text()
+    assert 'A' in text and 'B' in text
@@ -0,0 +1,107 @@
+import pytest
+
+from app.core.delta import Delta
+from app.core.history import BlobStore, HistoryManager, content_key
+
+
+def _delta(store, n):
+    """Delta mínimo con un stream propio en `store`."""
+    return Delta(objs_before={1: f'<< /N {n} >>'}, objs_after={1: f'<< /N {n + 1} >>'},
+                 streams_after={1: store.put(b'stream %d' % n * 100)})
+
+
+def test_history_undo_redo_order():
+    history = HistoryManager()
+    deltas = [_delta(history.store, i) for i in range(3)]
+    for d in deltas:
+        history.push(d)
+    assert history.can_undo() and not history.can_redo()
+    assert [history.undo() for _ in range(3)] == deltas[::-1]
+    assert not history.can_undo()
+    with pytest.raises(RuntimeError):
+        history.undo()
+    assert history.redo() == deltas[0]
+    assert history.can_redo()
+
+
+def test_history_push_truncates_redo_and_releases():
+    history = HistoryManager()
+    for i in range(3):
+        history.push(_delta(history.store, i))
+    history.undo()
+    history.undo()
+    history.push(_delta(history.store, 9))
+    assert not history.can_redo()
+    assert history.stats()['entries'] == 2
+    assert len(history.store) == 2
+
+
+def test_history_ignores_empty_delta():
+    history = HistoryManager()
+    history.push(Delta())
+    assert not history.can_undo()
+
+
+def test_history_reset():
+    history = HistoryManager()
+    history.push(_delta(history.store, 0))
+    history.reset()
+    assert not history.can_undo() and len(history.store) == 0
+
+
+def test_history_packs_cold_entries():
+    history = HistoryManager(hot=1)
+    deltas = [_delta(history.store, i) for i in range(5)]
+    for d in deltas:
+        history.push(d)
+    stats = history.stats()
+    assert stats['hot'] == 1 and stats['compressed'] == 4
+    for d in reversed(deltas):
+        assert history.undo() == d   # desempaquetado igual al original
+
+
+def test_history_spills_over_memory_budget():
+    history = HistoryManager(memory_budget=1000, hot=1)
+    for i in range(10):
+        history.push(_delta(history.store, i))
+    assert history.store.ram_bytes <= 1000
+    assert history.store.spilled() > 0
+    for i in reversed(range(10)):
+        assert history.undo().objs_after[1] == f'<< /N {i + 1} >>'
+
+
+def test_history_evicts_oldest_over_limits():
+    history = HistoryManager(limit=3)
+    for i in range(5):
+        history.push(_delta(history.store, i))
+    assert history.stats()['entries'] == 3 and history.evicted == 2
+    history = HistoryManager(memory_budget=0, disk_budget=2000, hot=0)
+    for i in range(5):
+        history.push(_delta(history.store, i))
+    assert history.disk_usage() <= 2000 and history.evicted > 0
+
+
+def test_blob_store_dedupes_and_counts_refs():
+    store = BlobStore()
+    a = store.put(b'logo')
+    b = store.put(b'logo')
+    assert a == b == content_key(b'logo')
+    assert len(store) == 1 and store.ram_bytes == 4
+    store.release([a])
+    assert store.get(a) == b'logo'
+    store.release([a])
+    assert len(store) == 0 and store.ram_bytes == 0
+    store.release([a])  # claves ya liberadas se ignoran
+
+
+def test_blob_store_spill_reads_back_and_compacts():
+    store = BlobStore()
+    keys = [store.put(bytes([i]) * 1000) for i in range(10)]
+    store.spill_until(3000)
+    assert store.ram_bytes <= 3000
+    assert store.spilled() == 7 and store.disk_bytes() == 7000
+    assert all(store.get(k) == bytes([i]) * 1000 for i, k in enumerate(keys))
+    store.release(keys)
+    assert store.disk_bytes() == 0
+    store.compact()
+    assert store._spill.size == 0
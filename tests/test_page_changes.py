@@ -0,0 +1,53 @@
+def test_first_report_is_reset(manager):
+    changes = manager.page_changes()
+    assert changes.reset and changes.inserted == [0, 1, 2, 3]
+    changes = manager.page_changes()
+    assert not changes.reset and not changes.changed and not changes.removed
+    assert changes.old_index == [0, 1, 2, 3] and not changes.reordered
+
+
+def test_move(manager):
+    manager.page_changes()
+    manager.move_page(0, 2)
+    changes = manager.page_changes()
+    assert changes.old_index == [1, 2, 0, 3]
+    assert changes.reordered
+    assert not changes.changed and not changes.removed and not changes.inserted
+
+
+def test_remove_and_undo(manager):
+    manager.page_changes()
+    manager.remove_page(1)
+    changes = manager.page_changes()
+    assert changes.removed == [1]
+    assert changes.old_index == [0, 2, 3]
+    assert not changes.changed and not changes.reordered
+    manager.undo()
+    changes = manager.page_changes()
+    assert changes.old_index == [0, None, 1, 2]
+    assert changes.inserted == [1] and not changes.removed and not changes.changed
+
+
+def test_duplicate(manager):
+    manager.page_changes()
+    manager.duplicate_page(1)
+    changes = manager.page_changes()
+    assert changes.old_index == [0, 1, None, 2, 3]
+    assert changes.inserted == [2]
+    assert not changes.changed and not changes.removed and not changes.reordered
+
+
+def test_rotate(manager):
+    manager.page_changes()
+    manager.rotate_page(2, 90)
+    changes = manager.page_changes()
+    assert changes.changed == {2}
+    assert changes.old_index == [0, 1, 2, 3] and not changes.inserted
+    manager.undo()
+    assert manager.page_changes().changed == {2}
+
+
+def test_close_reports_reset(manager):
+    manager.page_changes()
+    manager.close()
+    assert manager.page_changes().reset
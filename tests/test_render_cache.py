@@ -0,0 +1,58 @@
+import fitz  # PyMuPDF
+
+from app.core.render_cache import RenderCache, pixmap_nbytes
+
+
+def _pix(side=10):
+    return fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, side, side), False)
+
+
+SIZE = pixmap_nbytes(_pix())
+
+
+def test_hit_and_miss():
+    cache = RenderCache()
+    pix = _pix()
+    cache.put(7, (0, 1.0), pix)
+    assert cache.get(7, (0, 1.0)) is pix
+    assert cache.get(7, (1, 1.0)) is None and cache.get(8, (0, 1.0)) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_byte_cap_evicts_least_recent():
+    cache = RenderCache(max_bytes=3 * SIZE)
+    for zoom in (1, 2, 3):
+        cache.put(1, zoom, _pix())
+    cache.get(1, 1)             # 1 pasa a ser la más reciente
+    cache.put(1, 4, _pix())
+    assert cache.nbytes == 3 * SIZE and len(cache) == 3
+    assert [cache.get(1, z) is not None for z in (1, 2, 3, 4)] == [True, False, True, True]
+
+
+def test_replace_same_key_keeps_count():
+    cache = RenderCache()
+    cache.put(1, 1, _pix())
+    cache.put(1, 1, _pix(20))
+    assert len(cache) == 1 and cache.nbytes == pixmap_nbytes(_pix(20))
+
+
+def test_oversized_pixmap_is_not_cached():
+    cache = RenderCache(max_bytes=2 * SIZE)
+    cache.put(1, 1, _pix())
+    cache.put(2, 1, _pix(50))
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None and cache.nbytes == SIZE
+
+
+def test_drop_page():
+    cache = RenderCache()
+    for page in (1, 2):
+        for zoom in (1, 2):
+            cache.put(page, zoom, _pix())
+    assert sorted(k for k, _ in cache.page_items(1)) == [1, 2]
+    cache.drop_page(1)
+    assert not cache.page_items(1) and len(cache) == 2
+    assert cache.nbytes == 2 * SIZE
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
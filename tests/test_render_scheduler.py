@@ -0,0 +1,97 @@
+import itertools
+import time
+
+import pytest
+
+from app.ui.render_scheduler import RenderScheduler
+
+
+class _Loop:
+    """Sustituto del widget de Tk: after/after_idle en una cola que se bombea a mano."""
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._calls = {}
+
+    def after(self, ms, fn):
+        call_id = next(self._ids)
+        self._calls[call_id] = fn
+        return call_id
+
+    def after_idle(self, fn):
+        return self.after(0, fn)
+
+    def after_cancel(self, call_id):
+        self._calls.pop(call_id, None)
+
+    def run(self, until, timeout=60):
+        end = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < end, 'sin respuesta del render'
+            calls, self._calls = self._calls, {}
+            for fn in calls.values():
+                fn()
+            time.sleep(0.01)
+
+
+@pytest.fixture
+def ready_worker(manager):
+    worker = manager.raster_worker()
+    assert worker is not None
+    end = time.monotonic() + 60
+    while not worker.ready:
+        assert time.monotonic() < end
+        worker.poll()
+        time.sleep(0.01)
+    return worker
+
+
+def _on_main_thread(manager, monkeypatch):
+    calls = []
+    render = manager.get_page_pixmap
+    monkeypatch.setattr(manager, 'get_page_pixmap', lambda *a: calls.append(a) or render(*a))
+    return calls
+
+
+def test_edited_page_renders_in_worker(manager, ready_worker, monkeypatch):
+    manager.add_highlight_rect(1, (10, 10, 200, 200))
+    expected = manager.get_page_pixmap(1, 1.5).samples
+    manager.render_cache.clear()
+    main = _on_main_thread(manager, monkeypatch)
+    loop = _Loop()
+    scheduler = RenderScheduler(loop, manager, prefetch=0)
+    got = []
+    scheduler.request(1, 1.5, got.append)
+    loop.run(lambda: got)
+    assert not main
+    assert got[0].samples == expected
+    assert manager.cached_pixmap(1, 1.5) is not None
+    # Otra edición: nueva revisión, nueva copia para el proceso
+    key = manager.share_edited_page(1)
+    manager.add_highlight_rect(1, (300, 300, 400, 400))
+    assert manager.share_edited_page(1) != key
+    got.clear()
+    scheduler.request(1, 1.5, got.append)
+    loop.run(lambda: got)
+    assert not main
+    assert got[0].samples == manager.get_page_pixmap(1, 1.5).samples
+
+
+def test_failed_share_falls_back_to_main_thread(manager, ready_worker, monkeypatch):
+    manager.add_highlight_rect(1, (10, 10, 200, 200))
+    monkeypatch.setattr(manager, 'share_edited_page', lambda index: None)
+    main = _on_main_thread(manager, monkeypatch)
+    loop = _Loop()
+    scheduler = RenderScheduler(loop, manager, prefetch=0)
+    got = []
+    scheduler.request(1, 1.0, got.append)
+    loop.run(lambda: got)
+    assert main == [(1, 1.0)]
+
+
+def test_stale_render_is_not_cached(manager, ready_worker):
+    xref, rev = manager.page_revision(0)
+    pix = manager.get_page_pixmap(0, 1.0)
+    manager.render_cache.clear()
+    manager.add_highlight_rect(0, (10, 10, 100, 100))
+    manager.store_pixmap(xref, 1.0, pix, rev=rev)
+    assert manager.cached_pixmap(0, 1.0) is None
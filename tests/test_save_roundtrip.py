@@ -0,0 +1,156 @@
+import fitz  # PyMuPDF
+import pytest
+
+from app.core import save_worker
+from tests.conftest import page_state
+
+
+def _highlight(doc):
+    doc.add_highlight_rect(0, (10, 10, 100, 100))
+
+
+def _remove_page(doc):
+    doc.remove_page(1)
+
+
+def _rotate(doc):
+    doc.rotate_page(2, 90)
+
+
+def _add_text(doc):
+    doc.add_text(3, 100, 200, 'nuevo')
+
+
+def _delete_annot(doc):
+    doc.add_highlight_rect(0, (10, 10, 100, 100))
+    doc.save()
+    doc.delete_annotation(0, next(doc._fitz_doc[0].annots()).xref)
+
+
+def _save(doc, mode, path):
+    if mode == 'incremental':
+        doc.save()
+    elif mode == 'compact':
+        doc.save(compact=True)
+    elif mode == 'pike':
+        doc.save_as(path)
+    else:
+        doc.save_optimized(path)
+
+
+def _on_disk(path):
+    with fitz.open(path) as doc:
+        assert not doc.is_repaired
+        return page_state(doc)
+
+
+MODES = ['incremental', 'compact', 'pike', 'optimize']
+EDITS = [_highlight, _remove_page, _rotate, _add_text, _delete_annot]
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('edit', EDITS, ids=lambda f: f.__name__.strip('_'))
+def test_edit_save_undo_redo(manager, tmp_path, mode, edit):
+    out = str(tmp_path / 'out.pdf')
+    edit(manager)
+    before = page_state(manager._fitz_doc)
+    manager.undo()
+    original = page_state(manager._fitz_doc)
+    manager.redo()
+    assert page_state(manager._fitz_doc) == before
+    _save(manager, mode, out)
+    assert not manager.dirty
+    assert _on_disk(manager.path) == before
+    manager.undo()
+    assert page_state(manager._fitz_doc) == original
+    manager.redo()
+    assert page_state(manager._fitz_doc) == before
+    manager.undo()
+    manager.save()  # incremental sobre lo que haya quedado adoptado
+    assert _on_disk(manager.path) == original
+    manager.redo()
+    assert page_state(manager._fitz_doc) == before
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_undone_edit_redone_after_save(manager, tmp_path, mode):
+    _highlight(manager)
+    after = page_state(manager._fitz_doc)
+    manager.undo()
+    _save(manager, mode, str(tmp_path / 'out.pdf'))
+    manager.redo()
+    assert page_state(manager._fitz_doc) == after
+    manager.save()
+    assert _on_disk(manager.path) == after
+
+
+def test_low_memory_roundtrip(manager, sample_pdf, monkeypatch):
+    monkeypatch.setattr('app.core.doc_manager.LOW_MEMORY_BYTES', 0)
+    manager.close()
+    manager.open(sample_pdf)
+    assert manager._backing is not None
+    original = page_state(manager._fitz_doc)
+    _remove_page(manager)
+    _highlight(manager)
+    edited = page_state(manager._fitz_doc)
+    for compact in (False, True, False):
+        manager.save(compact=compact)
+        assert _on_disk(sample_pdf) == edited
+    manager.undo()
+    manager.undo()
+    assert page_state(manager._fitz_doc) == original
+    manager.save()
+    assert _on_disk(sample_pdf) == original
+
+
+def test_failed_edit_does_not_outlive_save(manager, tmp_path):
+    image = tmp_path / 'broken.png'
+    image.write_bytes(b'not an image')
+    assert not manager.add_image(0, (10, 10, 100, 100), str(image))
+    assert not manager.add_text_box(0, (10, 10, 100, 100), '')
+    _highlight(manager)
+    assert not manager.update_text_annotation(0, next(manager._fitz_doc[0].annots()).xref, text='x')
+    manager.save()
+    _highlight(manager)
+    _rotate(manager)
+    edited = page_state(manager._fitz_doc)
+    manager.save()
+    assert _on_disk(manager.path) == edited
+
+
+@pytest.mark.parametrize('low_memory', [False, True])
+def test_incremental_snapshot_holds_only_the_tail(manager, sample_pdf, low_memory, monkeypatch):
+    holes = []
+
+    def fill(snapshot, base, size):
+        with open(snapshot, 'rb') as f:
+            holes.append(f.read(size) == bytes(size))   # el original aún no está
+        fill_original(snapshot, base, size)
+    fill_original = save_worker._fill
+    monkeypatch.setattr(save_worker, '_fill', fill)
+    manager.close()
+    manager.open(sample_pdf, low_memory=low_memory)
+    for page in range(3):
+        manager.add_highlight_rect(page, (10, 10, 100, 100))
+        edited = page_state(manager._fitz_doc)
+        manager.save()
+        assert _on_disk(sample_pdf) == edited
+    assert holes == [True] * 3
+
+
+@pytest.mark.parametrize('slack', [16, 1024 * 1024])
+def test_incremental_saves_grow_source_in_place(manager, sample_pdf, monkeypatch, slack):
+    monkeypatch.setattr('app.core.doc_manager._SOURCE_SLACK', slack)
+    manager.close()
+    manager.open(sample_pdf)
+    for page in range(4):
+        manager.add_highlight_rect(page, (10, 10, 100, 100))
+        manager.save()
+        with open(sample_pdf, 'rb') as f:
+            assert bytes(manager._source) == f.read()
+    edited = page_state(manager._fitz_doc)
+    manager.undo()
+    manager.save()
+    manager.redo()
+    manager.save()
+    assert _on_disk(sample_pdf) == edited
@@ -0,0 +1,119 @@
+import os
+import stat
+
+import fitz  # PyMuPDF
+import pytest
+
+from app.core import save_worker
+from app.core.save_worker import SaveJob, commit_file, incremental_tail, temp_path
+from tests.conftest import make_pdf, page_state
+
+
+def _edited(path):
+    """Documento abierto desde `path` con una anotación nueva en la página 0."""
+    doc = fitz.open(path)
+    doc[0].add_highlight_annot(fitz.Rect(10, 10, 100, 100))
+    return doc
+
+
+def test_temp_path_is_next_to_target(tmp_path):
+    tmp = temp_path(str(tmp_path / 'out.pdf'))
+    assert os.path.dirname(tmp) == str(tmp_path) and os.path.exists(tmp)
+    assert os.path.basename(tmp).startswith('.out.pdf.')
+
+
+def test_commit_file_keeps_mode(tmp_path):
+    path = tmp_path / 'out.pdf'
+    path.write_bytes(b'old')
+    os.chmod(path, 0o640)
+    tmp = temp_path(str(path))
+    with open(tmp, 'wb') as f:
+        f.write(b'new')
+    commit_file(tmp, str(path))
+    assert path.read_bytes() == b'new' and not os.path.exists(tmp)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+@pytest.mark.parametrize('from_file', [False, True], ids=['bytes', 'file'])
+def test_incremental_tail_matches_full_save(tmp_path, from_file):
+    src = make_pdf(tmp_path / 'in.pdf')
+    data = open(src, 'rb').read()
+    doc = _edited(src)
+    tail = incremental_tail(doc, src if from_file else data, len(data))
+    full = tmp_path / 'full.pdf'
+    doc.save(str(full), incremental=False)
+    with fitz.open(stream=data + tail, filetype='pdf') as joined, fitz.open(str(full)) as ref:
+        assert not joined.is_repaired
+        assert page_state(joined) == page_state(ref)
+    assert len(tail) < len(data)
+
+
+@pytest.mark.parametrize('from_file', [False, True], ids=['bytes', 'file'])
+def test_fill_copies_base_into_hole(tmp_path, from_file):
+    snapshot = tmp_path / 'snap'
+    snapshot.write_bytes(b'\0' * 10 + b'tail')
+    base = b'0123456789extra'
+    if from_file:
+        (tmp_path / 'base').write_bytes(base)
+        with open(tmp_path / 'base', 'rb') as f:
+            save_worker._fill(str(snapshot), f, 10)
+    else:
+        save_worker._fill(str(snapshot), memoryview(base), 10)
+    assert snapshot.read_bytes() == b'0123456789tail'
+
+
+def test_fill_short_base_fails(tmp_path):
+    (tmp_path / 'snap').write_bytes(b'\0' * 10)
+    (tmp_path / 'base').write_bytes(b'short')
+    with open(tmp_path / 'base', 'rb') as f, pytest.raises(EOFError):
+        save_worker._fill(str(tmp_path / 'snap'), f, 10)
+
+
+@pytest.mark.parametrize('mode', [None, 'compact', 'pike', 'optimize'])
+def test_save_job_modes(tmp_path, mode):
+    src = make_pdf(tmp_path / 'in.pdf')
+    doc = _edited(src)
+    expected = page_state(doc)
+    path = str(tmp_path / 'out.pdf')
+    snapshot = temp_path(path)
+    doc.save(snapshot)
+    job = SaveJob(snapshot, path, mode, linearize=mode == 'optimize', edits=1)
+    assert job.wait(60)
+    assert job.error is None and job.progress == 1.0 and job.info == {'edits': 1}
+    assert not os.path.exists(snapshot)
+    with fitz.open(path) as out:
+        assert not out.is_repaired
+        assert page_state(out) == expected
+        assert out.is_fast_webaccess == (mode == 'optimize')
+
+
+def test_save_job_incremental_base(tmp_path):
+    src = make_pdf(tmp_path / 'in.pdf')
+    data = open(src, 'rb').read()
+    doc = _edited(src)
+    expected = page_state(doc)
+    tail = incremental_tail(doc, data, len(data))
+    snapshot = temp_path(src)
+    with open(snapshot, 'wb') as f:
+        f.seek(len(data))
+        f.write(tail)
+    base = open(src, 'rb')
+    job = SaveJob(snapshot, src, base=base, base_size=len(data))
+    assert job.wait(60) and job.error is None
+    assert base.closed
+    with fitz.open(src) as out:
+        assert not out.is_repaired
+        assert page_state(out) == expected
+
+
+def test_save_job_error_keeps_target(tmp_path):
+    path = tmp_path / 'out.pdf'
+    path.write_bytes(b'old')
+    snapshot = temp_path(str(path))
+    with open(snapshot, 'wb') as f:
+        f.write(b'not a pdf')
+    job = SaveJob(snapshot, str(path), 'pike')
+    assert job.wait(60)
+    assert job.error
+    assert path.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['out.pdf']  # sin temporales
@@ -0,0 +1,72 @@
+import os
+
+import fitz  # PyMuPDF
+
+from app.core.doc_manager import DocumentManager
+from app.core.thumb_cache import ThumbnailCache
+
+
+def _keys(doc):
+    return [doc.page_content_key(i) for i in range(doc.page_count())]
+
+
+def _reopened_keys(path):
+    doc = DocumentManager()
+    doc.open(path)
+    try:
+        return _keys(doc)
+    finally:
+        doc.close()
+
+
+def test_key_stable_across_reopen_and_saves(manager):
+    keys = _keys(manager)
+    assert len(set(keys)) == 4
+    assert _reopened_keys(manager.path) == keys
+    manager.add_highlight_rect(1, (10, 10, 100, 100))
+    edited = _keys(manager)
+    assert [k == e for k, e in zip(keys, edited)] == [True, False, True, True]
+    manager.save()
+    assert _keys(manager) == edited
+    assert _reopened_keys(manager.path) == edited
+    manager.save(compact=True)
+    assert _reopened_keys(manager.path) == edited
+    manager.undo()
+    assert _keys(manager) == keys
+
+
+def test_key_ignores_object_numbering(manager, tmp_path):
+    keys = _keys(manager)
+    out = str(tmp_path / 'renumbered.pdf')
+    with fitz.open(manager.path) as doc:
+        doc.save(out, garbage=4)    # renumera los objetos
+    assert _reopened_keys(out) == keys
+
+
+def _pix(color):
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), False)
+    pix.set_rect(pix.irect, color)
+    return pix
+
+
+def test_cache_hits_by_key_and_zoom(tmp_path):
+    cache = ThumbnailCache(str(tmp_path))
+    cache.put('a', 0.12, _pix((255, 0, 0)))
+    hit = cache.get('a', 0.12)
+    assert hit is not None and hit.pixel(0, 0) == (255, 0, 0)
+    assert cache.get('a', 0.2) is None and cache.get('b', 0.12) is None
+    # Otra instancia sobre el mismo directorio (otra sesión)
+    assert ThumbnailCache(str(tmp_path)).get('a', 0.12) is not None
+
+
+def test_cache_evicts_oldest_first(tmp_path):
+    size = len(_pix((0, 0, 0)).tobytes('png'))
+    cache = ThumbnailCache(str(tmp_path), max_bytes=3 * size)
+    for i, key in enumerate('abc'):
+        cache.put(key, 0.12, _pix((0, 0, 0)))
+        os.utime(tmp_path / ThumbnailCache._name(key, 0.12), (1000 + i, 1000 + i))
+    assert cache.get('a', 0.12) is not None     # renueva 'a': ahora la más antigua es 'b'
+    cache.put('d', 0.12, _pix((0, 0, 0)))
+    # Baja al 90 % del tope: se van las dos de uso más antiguo
+    assert cache.nbytes <= cache.max_bytes * 0.9
+    assert [cache.get(k, 0.12) is not None for k in 'abcd'] == [True, False, False, True]
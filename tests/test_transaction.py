@@ -0,0 +1,58 @@
+from tests.conftest import page_state
+
+
+def _entries(doc):
+    return doc._history.stats()['entries']
+
+
+def test_edits_in_transaction_are_one_step(manager):
+    original = page_state(manager._fitz_doc)
+    with manager.transaction():
+        for i in range(5):
+            manager.add_highlight_rect(i % 4, (10, 10 + 20 * i, 100, 25 + 20 * i))
+        manager.rotate_page(2, 90)
+    after = page_state(manager._fitz_doc)
+    assert _entries(manager) == 1
+    assert manager.undo()
+    assert page_state(manager._fitz_doc) == original
+    assert not manager._history.can_undo()
+    assert manager.redo()
+    assert page_state(manager._fitz_doc) == after
+
+
+def test_noop_or_failed_edit_keeps_the_rest(manager, tmp_path):
+    original = page_state(manager._fitz_doc)
+    with manager.transaction():
+        manager.add_highlight_rect(0, (10, 10, 100, 100))
+        assert not manager.add_text_box(1, (72, 400, 300, 500), '')
+        assert not manager.add_image(1, (72, 400, 300, 500), str(tmp_path / 'missing.png'))
+        manager.add_text(2, 72, 200, 'dentro')
+    after = page_state(manager._fitz_doc)
+    assert _entries(manager) == 1
+    manager.undo()
+    assert page_state(manager._fitz_doc) == original
+    manager.redo()
+    assert page_state(manager._fitz_doc) == after
+
+
+def test_only_failed_edits_record_nothing(manager):
+    with manager.transaction():
+        assert not manager.add_text_box(0, (72, 400, 300, 500), '')
+    assert _entries(manager) == 0
+    assert manager._capture is None and not manager._steps
+
+
+def test_nested_transactions_push_on_outermost_close(manager):
+    with manager.transaction():
+        manager.add_text(0, 72, 200, 'uno')
+        with manager.transaction():
+            manager.add_text(1, 72, 200, 'dos')
+            with manager.transaction():
+                manager.add_text(2, 72, 200, 'tres')
+            assert _entries(manager) == 0
+        assert _entries(manager) == 0
+        assert not manager.undo()   # no se deshace a mitad de transacción
+    assert _entries(manager) == 1
+    manager.undo()
+    assert all(w not in manager._fitz_doc[i].get_text()
+               for i, w in enumerate(('uno', 'dos', 'tres')))